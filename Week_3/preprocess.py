@@ -1,62 +1,22 @@
 from time import perf_counter_ns
 import os
-import gzip
-import pyarrow as pa
-import pyarrow.csv as pv
-import pyarrow.parquet as pq
+import sys
 
-def convert_gzip_to_parquet(gzip_path, parquet_path, batch_size=512 * 1024**2):
-    with gzip.open(gzip_path, mode='rb') as file:
-        csv_reader = pv.open_csv(
-            file,
-            parse_options=pv.ParseOptions(delimiter=","),
-            convert_options=pv.ConvertOptions(include_columns=["timestamp", "pixel_color", "user_id"]),
-            read_options=pv.ReadOptions(block_size=batch_size) 
-        )
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.convert import convert_gzip_to_parquet
+from rplace.dataset import is_partitioned, write_partitioned
+from rplace.schema import is_compact
+from rplace.user_ids import USER_IDS_PATH, UserIdEncoder
 
-        for i, batch in enumerate(csv_reader):
-            table = pa.Table.from_batches([batch])
-
-            batch_file = f"{parquet_path}_part_{i}.parquet"
-            pq.write_table(table, batch_file, compression="snappy")
-
-        batch_files = [f"{parquet_path}_part_{i}.parquet" for i in range(i + 1)]
-        final_table = pa.concat_tables([pq.read_table(f) for f in batch_files])
-        pq.write_table(final_table, parquet_path, compression="snappy")
-
-
-def update_user_id(parquet_path, output_path):
-    parquet_file = pq.ParquetFile(parquet_path)
-
-    user_mapping = {}
-    user_counter = 0
-
-    updated_row_groups = []
-
-    for i in range(parquet_file.num_row_groups):
-        row_group = parquet_file.read_row_group(i)
-
-        user_ids = row_group.column('user_id').to_pylist()
-
-        new_user_ids = []
-        for user_id in user_ids:
-            if user_id not in user_mapping:
-                user_mapping[user_id] = user_counter
-                user_counter += 1
-            new_user_ids.append(user_mapping[user_id])
-
-
-        new_user_id_column = pa.array(new_user_ids)
-
-        updated_row_group = row_group.remove_column(row_group.schema.get_field_index('user_id'))
-        updated_row_group = updated_row_group.append_column('user_id', new_user_id_column)
-
-
-        updated_row_groups.append(updated_row_group)
-
-    final_table = pa.concat_tables(updated_row_groups)
-
-    pq.write_table(final_table, output_path, compression='snappy')
+# Fused gzip -> Parquet conversion: CSV batches are decoded, compacted,
+# user-id encoded and written in one streaming pass, with no intermediate
+# file holding the user_id strings
+def convert_with_user_ids(gzip_path, output_path, mapping_path=USER_IDS_PATH):
+    encoder = UserIdEncoder(mapping_path)
+    convert_gzip_to_parquet(gzip_path, output_path, columns=["timestamp", "pixel_color", "user_id"], compact=True,
+                            transform=encoder.encode_table, pipeline=True)
+    encoder.save()
+    print(f"Encoded {len(encoder.users):,} user ids ({mapping_path})")
 
 
 def main():
@@ -64,15 +24,19 @@ def main():
 
     try:
         gzip_path = '2022_place_canvas_history.csv.gzip'
-        parquet_path = '2022_place_canvas_history_userid.parquet'
+        parquet_path = 'output_file.parquet'
+        dataset_path = 'output_dataset'
 
-        if not os.path.exists(parquet_path):
+        if not is_compact(parquet_path):
             print("Converting gzip to parquet...")
-            convert_gzip_to_parquet(gzip_path, parquet_path)
-            update_user_id('2022_place_canvas_history_userid.parquet', 'output_file.parquet')
+            convert_with_user_ids(gzip_path, parquet_path)
         else:
             print("Parquet file already exists. Skipping conversion.")
 
+        if not is_partitioned(parquet_path, dataset_path):
+            print("Partitioning parquet by hour...")
+            write_partitioned(parquet_path, dataset_path)
+
     except ValueError as e:
         print(f"Error: {e}")
 
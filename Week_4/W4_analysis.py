@@ -1,165 +1,191 @@
-import duckdb
-from datetime import datetime
 from time import perf_counter_ns
+import argparse
 import os
-import gzip
-import pyarrow.csv as pv
-import pyarrow.parquet as pq
-import matplotlib.pyplot as plt
+import sys
+import numpy as np
+from matplotlib.figure import Figure
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.convert import convert_gzip_to_parquet
+from rplace.coordinate_hours import ensure_coordinate_hours
+from rplace.db import connect, load_canvas
+from rplace.query import query
+from rplace.schema import is_compact, parse_coordinate
+from rplace.timestamps import check_time_format, check_time_range, to_epoch_ms
+
+# "x,y" strings as an (x, y) lookup relation for rplace.query
+def coordinates_lookup(coordinates):
+    points = [parse_coordinate(coordinate) for coordinate in coordinates]
+    return {"x": [x for x, _ in points], "y": [y for _, y in points]}
+
+# Every W4 query reads the (hour, x, y, pixel_color, placements) aggregate
+# of its window from rplace.coordinate_hours, built once per window
+def coordinate_hours(table, start_time, end_time):
+    return ensure_coordinate_hours(table, to_epoch_ms(start_time), to_epoch_ms(end_time))
+
+def process_parquet_with_duckdb(table, start_time, end_time):
+    aggregate = coordinate_hours(table, start_time, end_time)
 
-def check_time_format(time_str):
-    try:
-        return datetime.strptime(time_str, "%Y-%m-%d %H")
-    except ValueError:
-        raise ValueError(f"Invalid format: {time_str}")
-
-def check_time_range(start_time, end_time):
-    if end_time <= start_time:
-        raise ValueError("End time should be after start time.")
-    return True
-
-def convert_gzip_to_parquet(gzip_path, parquet_path, batch_size=512 * 1024**2):
-    with gzip.open(gzip_path, mode='rb') as file:
-        csv_reader = pv.open_csv(
-            file,
-            parse_options=pv.ParseOptions(delimiter=","),
-            convert_options=pv.ConvertOptions(include_columns=["timestamp", "pixel_color", "coordinate"]),
-            read_options=pv.ReadOptions(block_size=batch_size)
-        )
-
-        for i, batch in enumerate(csv_reader):
-            table = batch.to_table()
-            batch_file = f"{parquet_path}_part_{i}.parquet"
-            pq.write_table(table, batch_file, compression="snappy")
-
-        batch_files = [f"{parquet_path}_part_{i}.parquet" for i in range(i + 1)]
-        final_table = pq.concat_tables([pq.read_table(f) for f in batch_files])
-        pq.write_table(final_table, parquet_path, compression="snappy")
-
-def process_parquet_with_duckdb(file_path, start_time, end_time):
     query_pixel_color = f"""
     SELECT 
-        LOWER(TRIM(pixel_color)) AS pixel_color,
-        COUNT(*) AS color_count
-    FROM read_parquet('{file_path}')
-    WHERE 
-        timestamp IS NOT NULL
-        AND CAST(timestamp AS TIMESTAMP) >= '{start_time}' 
-        AND CAST(timestamp AS TIMESTAMP) < '{end_time}'
-        AND pixel_color IS NOT NULL
-    GROUP BY LOWER(TRIM(pixel_color))
+        palette.hex AS pixel_color,
+        counts.color_count
+    FROM (
+        SELECT pixel_color, SUM(placements)::BIGINT AS color_count
+        FROM {aggregate}
+        WHERE pixel_color IS NOT NULL
+        GROUP BY pixel_color
+    ) counts
+    JOIN {table}_palette palette USING (pixel_color)
     ORDER BY color_count DESC
     LIMIT 3
     """
 
     query_coordinate = f"""
     SELECT 
-        LOWER(TRIM(coordinate)) AS coordinate,
-        COUNT(*) AS coordinate_count
-    FROM read_parquet('{file_path}')
-    WHERE 
-        timestamp IS NOT NULL
-        AND CAST(timestamp AS TIMESTAMP) >= '{start_time}' 
-        AND CAST(timestamp AS TIMESTAMP) < '{end_time}'
-        AND coordinate IS NOT NULL
-    GROUP BY LOWER(TRIM(coordinate))
+        x || ',' || y AS coordinate,
+        SUM(placements)::BIGINT AS coordinate_count
+    FROM {aggregate}
+    WHERE x IS NOT NULL
+    GROUP BY x, y
     ORDER BY coordinate_count DESC
     LIMIT 3
     """
 
-    result_pixel_color = duckdb.query(query_pixel_color).to_df()
-    result_coordinate = duckdb.query(query_coordinate).to_df()
+    result_pixel_color = connect().query(query_pixel_color).to_df()
+    result_coordinate = connect().query(query_coordinate).to_df()
 
     return result_pixel_color, result_coordinate
 
-def process_hourly_changes_for_top_coordinates(file_path, start_time, end_time, top_coordinates):
-    top_coords_str = ",".join([f"'{coord}'" for coord in top_coordinates])
+def process_hourly_changes_for_top_coordinates(table, start_time, end_time, top_coordinates):
+    aggregate = coordinate_hours(table, start_time, end_time)
     
     query_hourly = f"""
         SELECT 
-            DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) AS hour,
-            LOWER(TRIM(coordinate)) AS coordinate,
-            COUNT(*) AS changes
-        FROM read_parquet('{file_path}')
-        WHERE 
-            timestamp IS NOT NULL
-            AND CAST(timestamp AS TIMESTAMP) >= '{start_time}'
-            AND CAST(timestamp AS TIMESTAMP) < '{end_time}'
-            AND LOWER(TRIM(coordinate)) IN ({top_coords_str})
-        GROUP BY 1, 2
+            epoch_ms(hour) AS hour,
+            x || ',' || y AS coordinate,
+            SUM(placements)::BIGINT AS changes
+        FROM {aggregate}
+        WHERE (x, y) IN (SELECT x, y FROM top_coordinates)
+        GROUP BY {aggregate}.hour, x, y
         ORDER BY 1, 2
     """
 
-    df_hourly = duckdb.query(query_hourly).to_df()
+    df_hourly = query(
+        query_hourly,
+        lookups={"top_coordinates": coordinates_lookup(top_coordinates)},
+        tables=[aggregate],
+    ).to_pandas()
     return df_hourly
 
-def process_hourly_median_changes_for_all_coordinates(file_path, start_time, end_time):
-    query_hourly_median = f"""
-        WITH changes_per_coord_per_hour AS (
+def _changes_per_coord_per_hour_sql(aggregate):
+    return f"""
             SELECT 
-                DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) AS hour,
-                LOWER(TRIM(coordinate)) AS coordinate,
-                COUNT(*) AS changes
-            FROM read_parquet('{file_path}')
-            WHERE 
-                timestamp IS NOT NULL
-                AND CAST(timestamp AS TIMESTAMP) >= '{start_time}'
-                AND CAST(timestamp AS TIMESTAMP) < '{end_time}'
-                AND coordinate IS NOT NULL
-            GROUP BY 1, 2
+                hour,
+                x,
+                y,
+                SUM(placements)::BIGINT AS changes
+            FROM {aggregate}
+            WHERE x IS NOT NULL
+            GROUP BY 1, 2, 3
+    """
+
+# Exact per-hour medians from a count histogram of the changes per
+# coordinate-hour: each hour becomes a few hundred (changes, coordinates)
+# pairs, and the median is read off their running totals (the mean of the
+# two middle values for an even count, like MEDIAN) without sorting every
+# coordinate-hour
+def process_hourly_median_changes_for_all_coordinates(table, start_time, end_time):
+    aggregate = coordinate_hours(table, start_time, end_time)
+    query_hourly_median = f"""
+        WITH changes_per_coord_per_hour AS ({_changes_per_coord_per_hour_sql(aggregate)}),
+        histogram AS (
+            SELECT hour, changes, COUNT(*) AS coordinates
+            FROM changes_per_coord_per_hour
+            GROUP BY hour, changes
+        ),
+        running AS (
+            SELECT
+                hour,
+                changes,
+                SUM(coordinates) OVER (PARTITION BY hour ORDER BY changes) AS up_to,
+                SUM(coordinates) OVER (PARTITION BY hour) AS total
+            FROM histogram
         )
         SELECT 
-            hour,
-            MEDIAN(changes) AS median_changes
-        FROM changes_per_coord_per_hour
-        GROUP BY hour
-        ORDER BY hour
+            epoch_ms(hour) AS hour,
+            (MIN(changes) FILTER (WHERE up_to > (total - 1) // 2)
+                + MIN(changes) FILTER (WHERE up_to > total // 2)) / 2 AS median_changes
+        FROM running
+        GROUP BY running.hour
+        ORDER BY 1
     """
 
-    df_hourly_median = duckdb.query(query_hourly_median).to_df()
+    df_hourly_median = connect().query(query_hourly_median).to_df()
     return df_hourly_median
 
-def process_distribution_changes_per_coord_per_hour(file_path, start_time, end_time):
-    query = f"""
-        WITH changes_per_coord_per_hour AS (
-            SELECT 
-                DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) AS hour,
-                LOWER(TRIM(coordinate)) AS coordinate,
-                COUNT(*) AS changes
-            FROM read_parquet('{file_path}')
-            WHERE 
-                timestamp IS NOT NULL
-                AND CAST(timestamp AS TIMESTAMP) >= '{start_time}'
-                AND CAST(timestamp AS TIMESTAMP) < '{end_time}'
-                AND coordinate IS NOT NULL
-            GROUP BY 1, 2
+# Histogram of the changes per coordinate-hour over `bins` log-spaced bins
+# from the smallest to the largest count, binned inside DuckDB. Returns
+# (bin edges, counts per bin), both empty when the window has no changes.
+def process_changes_histogram(table, start_time, end_time, bins=50):
+    aggregate = coordinate_hours(table, start_time, end_time)
+    histogram_sql = f"""
+        WITH changes_per_coord_per_hour AS ({_changes_per_coord_per_hour_sql(aggregate)}),
+        histogram AS (
+            SELECT changes, COUNT(*) AS coordinates
+            FROM changes_per_coord_per_hour
+            GROUP BY changes
+        ),
+        bounds AS (
+            SELECT MIN(changes) AS low, MAX(changes) AS high FROM histogram
         )
-        SELECT changes
-        FROM changes_per_coord_per_hour
+        SELECT
+            ANY_VALUE(low) AS low,
+            ANY_VALUE(high) AS high,
+            CASE
+                WHEN high = low THEN 0
+                ELSE LEAST(CAST(FLOOR(ln(changes / low) / ln(high / low) * {bins}) AS INTEGER), {bins - 1})
+            END AS bin,
+            SUM(coordinates)::BIGINT AS count
+        FROM histogram, bounds
+        GROUP BY bin
+        ORDER BY bin
     """
-    df_dist = duckdb.query(query).to_df()
-    return df_dist
-
-def get_top_colors_for_top_coordinates(file_path, start_time, end_time, top_coordinates):
-    top_coords_str = ",".join([f"'{coord}'" for coord in top_coordinates])
+    rows = connect().execute(histogram_sql).fetchall()
+    if not rows:
+        return np.array([]), np.array([], dtype=np.int64)
+    low, high = rows[0][0], rows[0][1]
+    edges = np.geomspace(low, high, bins + 1) if high > low else np.array([low - 0.5, low + 0.5])
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for _, _, bin_index, count in rows:
+        counts[bin_index] = count
+    return edges, counts
+
+def get_top_colors_for_top_coordinates(table, start_time, end_time, top_coordinates):
+    aggregate = coordinate_hours(table, start_time, end_time)
     
-    query = f"""
+    query_colors = f"""
         SELECT 
-            LOWER(TRIM(coordinate)) AS coordinate,
-            LOWER(TRIM(pixel_color)) AS pixel_color,
-            COUNT(*) AS color_count
-        FROM read_parquet('{file_path}')
-        WHERE 
-            timestamp IS NOT NULL
-            AND CAST(timestamp AS TIMESTAMP) >= '{start_time}'
-            AND CAST(timestamp AS TIMESTAMP) < '{end_time}'
-            AND LOWER(TRIM(coordinate)) IN ({top_coords_str})
-            AND pixel_color IS NOT NULL
-        GROUP BY coordinate, pixel_color
+            counts.x || ',' || counts.y AS coordinate,
+            palette.hex AS pixel_color,
+            counts.color_count
+        FROM (
+            SELECT x, y, pixel_color, SUM(placements)::BIGINT AS color_count
+            FROM {aggregate}
+            WHERE 
+                (x, y) IN (SELECT x, y FROM top_coordinates)
+                AND pixel_color IS NOT NULL
+            GROUP BY x, y, pixel_color
+        ) counts
+        JOIN {table}_palette palette USING (pixel_color)
         ORDER BY coordinate, color_count DESC
     """
 
-    df_colors = duckdb.query(query).to_df()
+    df_colors = query(
+        query_colors,
+        lookups={"top_coordinates": coordinates_lookup(top_coordinates)},
+        tables=[aggregate],
+    ).to_pandas()
 
     top_colors_per_coordinate = {}
     for coord in top_coordinates:
@@ -168,26 +194,47 @@ def get_top_colors_for_top_coordinates(file_path, start_time, end_time, top_coor
 
     return top_colors_per_coordinate
 
-def plot_hourly_changes(hourly_changes_df, hourly_median_df, top_3_coords):
-    plt.figure(figsize=(10, 6))
+# Figures are drawn with matplotlib's object API and saved to files, so no
+# display or interactive backend is needed
+
+def plot_hourly_changes(hourly_changes_df, hourly_median_df, top_3_coords, path):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
     
     for coord in top_3_coords:
         coord_data = hourly_changes_df[hourly_changes_df['coordinate'] == coord]
-        plt.plot(coord_data['hour'], coord_data['changes'], marker='o', label=f'Coord {coord}')
+        ax.plot(coord_data['hour'], coord_data['changes'], marker='o', label=f'Coord {coord}')
     
-    plt.plot(hourly_median_df['hour'], hourly_median_df['median_changes'], linestyle='--', marker='s', color='black', label='Median of all coords')
+    ax.plot(hourly_median_df['hour'], hourly_median_df['median_changes'], linestyle='--', marker='s', color='black', label='Median of all coords')
     
-    plt.xlabel('Hour')
-    plt.ylabel('Number of Changes')
-    plt.title('Hourly Changes for Top 3 Coordinates and Median')
-    plt.xticks(rotation=45)
-    plt.legend()
-    plt.grid()
-    plt.tight_layout()
-    plt.show()
-
+    ax.set_xlabel('Hour')
+    ax.set_ylabel('Number of Changes')
+    ax.set_title('Hourly Changes for Top 3 Coordinates and Median')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()
+    ax.grid()
+    fig.tight_layout()
+    fig.savefig(path)
+
+def plot_changes_histogram(edges, counts, path):
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    ax.hist(edges[:-1], bins=edges, weights=counts, log=True, edgecolor='black')
+    ax.set_xscale('log')
+    ax.set_xlabel('Changes per Coordinate-Hour (log scale)')
+    ax.set_ylabel('Frequency (log scale)')
+    ax.set_title('r/place Changes Distribution (Coordinate-Hour Aggregation)')
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Week 4 coordinate analysis")
+    parser.add_argument("--output-dir", default=".", help="directory for the figures")
+    parser.add_argument("--format", choices=["png", "svg"], default="png")
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
 
-def main():
     start_timer = perf_counter_ns()
 
     try:
@@ -198,13 +245,15 @@ def main():
         gzip_path = '2022_place_canvas_history.csv.gzip'
         parquet_path = '2022_place_canvas_history.parquet'
 
-        if not os.path.exists(parquet_path):
+        if not is_compact(parquet_path):
             print("Converting gzip to parquet...")
-            convert_gzip_to_parquet(gzip_path, parquet_path)
+            convert_gzip_to_parquet(gzip_path, parquet_path, compact=True)
         else:
             print("Parquet file already exists. Skipping conversion.")
 
-        result_pixel_color, result_coordinate = process_parquet_with_duckdb(parquet_path, start_time, end_time)
+        load_canvas(parquet_path, "canvas")
+
+        result_pixel_color, result_coordinate = process_parquet_with_duckdb("canvas", start_time, end_time)
         
         print("\nTop 3 coordinates and their counts:")
         if not result_coordinate.empty:
@@ -213,11 +262,13 @@ def main():
 
             top_3_coords = [row['coordinate'] for _, row in result_coordinate.iterrows()]
 
-            hourly_changes_df = process_hourly_changes_for_top_coordinates(parquet_path, start_time, end_time, top_3_coords)
-            hourly_median_df = process_hourly_median_changes_for_all_coordinates(parquet_path, start_time, end_time)
-            plot_hourly_changes(hourly_changes_df, hourly_median_df, top_3_coords)
+            hourly_changes_df = process_hourly_changes_for_top_coordinates("canvas", start_time, end_time, top_3_coords)
+            hourly_median_df = process_hourly_median_changes_for_all_coordinates("canvas", start_time, end_time)
+            hourly_path = os.path.join(args.output_dir, f"w4_hourly_changes.{args.format}")
+            plot_hourly_changes(hourly_changes_df, hourly_median_df, top_3_coords, hourly_path)
+            print(f"Saved {hourly_path}")
 
-            top_colors = get_top_colors_for_top_coordinates(parquet_path, start_time, end_time, top_3_coords)
+            top_colors = get_top_colors_for_top_coordinates("canvas", start_time, end_time, top_3_coords)
 
             print("\nTop 2 colors for each of the top 3 coordinates:")
             for coord, colors in top_colors.items():
@@ -226,20 +277,12 @@ def main():
                     print(f"  Color: {color} => {count} times")
         
         print("\nGenerating histogram of changes per coordinate-hour...")
-        df_dist = process_distribution_changes_per_coord_per_hour(
-            parquet_path,
-            start_time,
-            end_time
-        )
+        edges, counts = process_changes_histogram("canvas", start_time, end_time)
 
-        if not df_dist.empty:
-            plt.figure(figsize=(8,6))
-            plt.hist(df_dist['changes'], bins=50, log=True, edgecolor='black')
-            plt.xlabel('Changes per Coordinate-Hour')
-            plt.ylabel('Frequency (log scale)')
-            plt.title('r/place Changes Distribution (Coordinate-Hour Aggregation)')
-            plt.tight_layout()
-            plt.show()
+        if counts.sum():
+            histogram_path = os.path.join(args.output_dir, f"w4_changes_histogram.{args.format}")
+            plot_changes_histogram(edges, counts, histogram_path)
+            print(f"Saved {histogram_path}")
         else:
             print("No data found for histogram.")
 
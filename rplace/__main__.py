@@ -0,0 +1,38 @@
+import argparse
+from time import perf_counter_ns
+
+from rplace.engines import ENGINES, get_engine
+from rplace.timestamps import check_time_format, check_time_range
+
+# python -m rplace --engine duckdb --start "2022-04-01 12" --end "2022-04-01 13"
+# Several engines can be given to compare them on the same range.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rplace", description="Most placed color and pixel in a time range")
+    parser.add_argument("--engine", nargs="+", choices=list(ENGINES), default=["duckdb"])
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD HH")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD HH")
+    parser.add_argument("--gzip", default="2022_place_canvas_history.csv.gzip", help="canvas history CSV (gzip)")
+    args = parser.parse_args(argv)
+
+    try:
+        start_time = check_time_format(args.start)
+        end_time = check_time_format(args.end)
+        check_time_range(start_time, end_time)
+    except ValueError as e:
+        parser.error(str(e))
+
+    for name in args.engine:
+        engine = get_engine(name)
+        source = engine.prepare(args.gzip)
+
+        start_timer = perf_counter_ns()
+        common_pixel_color, common_coordinate = engine.most_placed(source, start_time, end_time)
+        exe_time = perf_counter_ns() - start_timer
+
+        print(f"[{name}] Most Placed pixel_color: {common_pixel_color}")
+        print(f"[{name}] Most Placed Pixel Location: ({common_coordinate})")
+        print(f"[{name}] Execution Time: {exe_time / 1_000_000} ms")
+
+if __name__ == "__main__":
+    main()
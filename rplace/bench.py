@@ -0,0 +1,283 @@
+import argparse
+import fnmatch
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+from time import perf_counter_ns
+
+from rplace.convert import convert_gzip_to_parquet
+from rplace.coordinate_hours import ensure_coordinate_hours
+from rplace.db import connect, load_canvas
+from rplace.engines import ENGINES, get_engine
+from rplace.metrics import format_bytes, io_counters, peak_rss_bytes
+from rplace.sessions import ensure_sessions
+from rplace.user_sketches import ensure_sketches
+from rplace.synthetic import generate_canvas
+from rplace.timestamps import check_time_format, check_time_range, to_epoch_ms
+from rplace.user_index import ensure_user_index
+
+# Offline benchmark over a (synthetic or real) canvas gzip in a data
+# directory. Every engine and every W1-W5 query is a case; each case runs in
+# a fresh process so peak RSS and I/O counters belong to that case alone.
+# A case's setup (building inputs such as the top coordinates or suspected
+# bots) is not timed; wall time, rows/s, peak RSS and bytes read cover only
+# the query itself.
+#
+#   python -m rplace.bench --data-dir /data/bench --rows 10000000 \
+#       --start "2022-04-01 12" --end "2022-04-01 18" \
+#       --output results.json --baseline baseline.json
+
+GZIP_PATH = "2022_place_canvas_history.csv.gzip"
+MERGED_PATH = "merged_canvas_history.parquet"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _script(relative_path):
+    path = os.path.join(REPO_DIR, relative_path)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _engine_case(name):
+    def setup(start_time, end_time):
+        engine = get_engine(name)
+        source = engine.prepare(GZIP_PATH)
+        return lambda: engine.most_placed(source, start_time, end_time)
+    return setup
+
+def _w3_case(function_name, **kwargs):
+    def setup(start_time, end_time):
+        function = getattr(_script("Week_3/analysis.py"), function_name)
+        return lambda: function("users", start_time, end_time, **kwargs)
+    return setup
+
+def _w4_top_coordinates(w4, start_time, end_time):
+    _, result_coordinate = w4.process_parquet_with_duckdb("canvas", start_time, end_time)
+    return result_coordinate["coordinate"].tolist()
+
+def _w4_case(function_name, needs_top_coordinates=False):
+    def setup(start_time, end_time):
+        w4 = _script("Week_4/W4_analysis.py")
+        function = getattr(w4, function_name)
+        if needs_top_coordinates:
+            top_coordinates = _w4_top_coordinates(w4, start_time, end_time)
+            return lambda: function("canvas", start_time, end_time, top_coordinates)
+        return lambda: function("canvas", start_time, end_time)
+    return setup
+
+def _w5_case(function_name):
+    def setup(start_time, end_time):
+        w5 = _script("Week_5/W5_analysis.py")
+        function = getattr(w5, function_name)
+        if function_name == "find_most_active_users":
+            return lambda: function("merged", top_percent=1)
+        top_users = w5.find_most_active_users("merged", top_percent=1)["user"].tolist()
+        if function_name == "find_sus_users_by_time_intervals":
+            return lambda: function("merged", top_users)
+        suspicious_users = w5.find_sus_users_by_time_intervals("merged", top_users)["user"].tolist()
+        return lambda: function("merged", suspicious_users)
+    return setup
+
+# name -> (setup, rows the query covers: "window" or "all")
+CASES = {
+    **{f"engine:{name}": (_engine_case(name), "window") for name in ENGINES},
+    "w3:users_color_rank": (_w3_case("users_color_rank"), "window"),
+    "w3:find_avg_sess_len": (_w3_case("find_avg_sess_len"), "window"),
+    "w3:find_pxl_percentiles": (_w3_case("find_pxl_percentiles"), "window"),
+    "w3:find_frst_time_usrs": (_w3_case("find_frst_time_usrs"), "window"),
+    "w3:run_metrics": (_w3_case("run_metrics"), "window"),
+    "w3:users_color_rank_sketch": (_w3_case("users_color_rank", exact=False), "window"),
+    "w3:find_pxl_percentiles_sketch": (_w3_case("find_pxl_percentiles", exact=False), "window"),
+    "w3:run_metrics_sketch": (_w3_case("run_metrics", exact=False), "window"),
+    "w4:top_colors_and_coordinates": (_w4_case("process_parquet_with_duckdb"), "window"),
+    "w4:hourly_changes_top_coordinates": (_w4_case("process_hourly_changes_for_top_coordinates", True), "window"),
+    "w4:hourly_median_changes": (_w4_case("process_hourly_median_changes_for_all_coordinates"), "window"),
+    "w4:changes_histogram": (_w4_case("process_changes_histogram"), "window"),
+    "w4:top_colors_top_coordinates": (_w4_case("get_top_colors_for_top_coordinates", True), "window"),
+    "w5:find_most_active_users": (_w5_case("find_most_active_users"), "all"),
+    "w5:find_sus_users_by_time_intervals": (_w5_case("find_sus_users_by_time_intervals"), "all"),
+    "w5:find_most_painted_coordinates_by_bots": (_w5_case("find_most_painted_coordinates_by_bots"), "all"),
+    "w5:track_hourly_changes_by_bots": (_w5_case("track_hourly_changes_by_bots"), "all"),
+}
+
+# Builds every layout the cases read; each step is skipped when current
+def prepare_layouts(start_time, end_time):
+    for name in ENGINES:
+        get_engine(name).prepare(GZIP_PATH)
+
+    _script("Week_3/preprocess.py").main()
+    load_canvas("output_dataset", "users")
+    ensure_sessions("users")
+    ensure_user_index("users")
+    ensure_sketches("users")
+
+    if not os.path.exists(MERGED_PATH):
+        convert_gzip_to_parquet(GZIP_PATH, MERGED_PATH, columns=["timestamp", "user_id", "pixel_color", "coordinate"])
+    load_canvas(MERGED_PATH, "merged")
+    ensure_coordinate_hours("canvas", to_epoch_ms(start_time), to_epoch_ms(end_time))
+
+    total, window = connect().execute(
+        f"SELECT COUNT(*), COUNT(*) FILTER (timestamp >= {to_epoch_ms(start_time)} AND timestamp < {to_epoch_ms(end_time)}) FROM canvas"
+    ).fetchone()
+    return {"all": total, "window": window}
+
+def _in_child(data_dir, target, args, conn):
+    try:
+        # Back to the platform default, so worker processes the case starts
+        # are children of this process and count towards its RSS and I/O
+        multiprocessing.set_start_method(None, force=True)
+        os.chdir(data_dir)
+        conn.send(("ok", target(*args)))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+# Runs target(*args) in a fresh process inside data_dir. DuckDB allows one
+# writer per database file, so the parent never opens it itself. Linux keeps
+# ru_maxrss across exec, so a spawned child would start at the parent's peak;
+# forkserver children are forked from a small server process instead.
+def run_isolated(data_dir, target, *args):
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_in_child, args=(data_dir, target, args, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        status, value = parent_conn.recv()
+    except EOFError:
+        status, value = "error", f"process exited with code {process.exitcode}"
+    process.join()
+    if status != "ok":
+        raise RuntimeError(value)
+    return value
+
+def measure_case(name, start_time, end_time):
+    setup, _ = CASES[name]
+    query = setup(start_time, end_time)
+
+    io_before = io_counters()
+    start_timer = perf_counter_ns()
+    query()
+    seconds = (perf_counter_ns() - start_timer) / 1e9
+    io_after = io_counters()
+
+    return {
+        "seconds": seconds,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_rss_children_bytes": peak_rss_bytes(children=True),
+        "read_bytes": io_after["read_bytes"] - io_before["read_bytes"] if io_after else None,
+        "rchar": io_after["rchar"] - io_before["rchar"] if io_after else None,
+    }
+
+def run_benchmark(data_dir, start_time, end_time, patterns=("*",), repeat=1, rows=None, seed=0):
+    os.makedirs(data_dir, exist_ok=True)
+    gzip_path = os.path.join(data_dir, GZIP_PATH)
+    if not os.path.exists(gzip_path):
+        if rows is None:
+            raise ValueError(f"No {GZIP_PATH} in {data_dir}; pass --rows to generate one")
+        generate_canvas(gzip_path, rows, seed)
+
+    row_counts = run_isolated(data_dir, prepare_layouts, start_time, end_time)
+    names = [name for name in CASES if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+
+    results = []
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            runs.append(run_isolated(data_dir, measure_case, name, start_time, end_time))
+        best = min(runs, key=lambda run: run["seconds"])
+        case_rows = row_counts[CASES[name][1]]
+        results.append({
+            "case": name,
+            **best,
+            "rows": case_rows,
+            "rows_per_second": case_rows / best["seconds"] if best["seconds"] else None,
+            "runs": [run["seconds"] for run in runs],
+        })
+        print(f"{name}: {best['seconds']:.3f} s, peak RSS {format_bytes(_peak_rss(best))}")
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "data_dir": os.path.abspath(data_dir),
+            "gzip_bytes": os.path.getsize(gzip_path),
+            "rows": row_counts["all"],
+            "window_rows": row_counts["window"],
+            "start": f"{start_time:%Y-%m-%d %H}",
+            "end": f"{end_time:%Y-%m-%d %H}",
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+def _change(current, baseline):
+    if current is None or not baseline:
+        return "n/a"
+    return f"{(current - baseline) / baseline * 100:+.1f}%"
+
+# Largest of the case process and its worker processes
+def _peak_rss(result):
+    peaks = [result["peak_rss_bytes"], result["peak_rss_children_bytes"]]
+    return max((peak for peak in peaks if peak is not None), default=None)
+
+# Markdown table of a run, against a previous results file when given
+def comparison_table(report, baseline=None):
+    previous = {result["case"]: result for result in baseline["results"]} if baseline else {}
+    lines = [
+        "| Case | Time (s) | Baseline (s) | Change | Rows/s | Peak RSS | Bytes read |",
+        "|---|---:|---:|---:|---:|---:|---:|",
+    ]
+    for result in report["results"]:
+        old = previous.get(result["case"], {})
+        old_seconds = old.get("seconds")
+        lines.append(
+            f"| {result['case']} | {result['seconds']:.3f} | "
+            f"{f'{old_seconds:.3f}' if old_seconds is not None else 'n/a'} | {_change(result['seconds'], old_seconds)} | "
+            f"{result['rows_per_second'] or 0:,.0f} | {format_bytes(_peak_rss(result))} | {format_bytes(result['rchar'])} |"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rplace.bench", description="Benchmark every engine and W1-W5 query")
+    parser.add_argument("--data-dir", default="bench_data")
+    parser.add_argument("--rows", type=int, help="generate synthetic data with this many rows if the data dir has none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2022-04-01 12", help="YYYY-MM-DD HH")
+    parser.add_argument("--end", default="2022-04-01 18", help="YYYY-MM-DD HH")
+    parser.add_argument("--cases", nargs="+", default=["*"], help="case name patterns, e.g. 'engine:*' 'w3:*'")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case; the fastest is reported")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    try:
+        start_time = check_time_format(args.start)
+        end_time = check_time_format(args.end)
+        check_time_range(start_time, end_time)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = run_benchmark(args.data_dir, start_time, end_time, args.cases, args.repeat, args.rows, args.seed)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    table = comparison_table(report, baseline)
+    with open(os.path.splitext(args.output)[0] + ".md", "w") as file:
+        file.write(table + "\n")
+    print(table)
+
+if __name__ == "__main__":
+    sys.exit(main())
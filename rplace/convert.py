@@ -0,0 +1,230 @@
+import gzip
+import json
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter_ns
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from rplace.metrics import format_bytes, peak_rss_bytes
+from rplace.schema import (
+    REJECTION_REASONS, compact_table, is_compact, moderation_path, new_palette, normalize_table, quality_report_path,
+    quarantine_path, write_palette,
+)
+
+CANVAS_COLUMNS = ["timestamp", "pixel_color", "coordinate"]
+
+def _read_batches(gzip_path, columns, batch_size):
+    with gzip.open(gzip_path, mode='rb') as file:
+        csv_reader = pv.open_csv(
+            file,
+            parse_options=pv.ParseOptions(delimiter=","),
+            convert_options=pv.ConvertOptions(include_columns=columns),
+            read_options=pv.ReadOptions(block_size=batch_size)
+        )
+        for batch in csv_reader:
+            yield pa.Table.from_batches([batch])
+
+# Runs `iterable` on a background thread, keeping up to `depth` items ready.
+# Errors are re-raised in the consumer; closing the generator stops the
+# thread.
+def _prefetch(iterable, depth=2):
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    break
+                put(("item", item))
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+        finally:
+            iterable.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+# Streams CSV batches straight into one ParquetWriter. Batches are buffered
+# only until a full row group is available, so memory stays bounded by
+# about one row group plus one CSV block regardless of the file size.
+# With compact=True the batches are normalized and rewritten into the typed
+# layout from rplace.schema, and the palette and moderation side tables are
+# written next to the output. Rows that fail normalization (bad timestamp,
+# color or coordinate) are not written; they go to the quarantine side
+# table, and a JSON quality report counts them per reason. `transform`,
+# when given, is applied to every table after that (e.g. to encode user
+# ids) before it is written.
+# With pipeline=True gzip decompression and CSV parsing run on one thread
+# and Parquet encoding and writing on another, each a few batches ahead of
+# or behind the compaction and transform on the calling thread; pyarrow and
+# zlib release the GIL, so the three stages overlap.
+def convert_gzip_to_parquet(gzip_path, parquet_path, columns=CANVAS_COLUMNS, row_group_size=1_000_000,
+                            batch_size=64 * 1024**2, compression="snappy", compact=False, transform=None,
+                            pipeline=False):
+    start_timer = perf_counter_ns()
+    tmp_path = f"{parquet_path}.tmp"
+    writer = None
+    moderation_writer = None
+    quarantine_writer = None
+    quarantine_tmp_path = f"{quarantine_path(parquet_path)}.tmp"
+    moderation_tmp_path = f"{moderation_path(parquet_path)}.tmp"
+    rejected_counts = dict.fromkeys(REJECTION_REASONS, 0)
+    read_rows = 0
+    rect_rows = 0
+    palette = new_palette()
+    total_rows = 0
+
+    batches = _read_batches(gzip_path, columns, batch_size)
+    executor = ThreadPoolExecutor(max_workers=1) if pipeline else None
+    writes = deque()
+
+    def write(table):
+        if executor is None:
+            writer.write_table(table, row_group_size=row_group_size)
+            return
+        writes.append(executor.submit(writer.write_table, table, row_group_size=row_group_size))
+        while len(writes) > 2:
+            writes.popleft().result()
+
+    try:
+        if pipeline:
+            batches = _prefetch(batches)
+
+        pending = []
+        pending_rows = 0
+        for table in batches:
+            if compact:
+                read_rows += table.num_rows
+                table, timestamps, rejected = normalize_table(table)
+                if rejected is not None:
+                    for row in pc.value_counts(rejected.column("reason")).to_pylist():
+                        rejected_counts[row["values"]] += row["counts"]
+                    if quarantine_writer is None:
+                        quarantine_writer = pq.ParquetWriter(quarantine_tmp_path, rejected.schema, compression=compression)
+                    quarantine_writer.write_table(rejected)
+                table, rects = compact_table(table, palette, timestamps)
+                if rects is not None and rects.num_rows:
+                    rect_rows += rects.num_rows
+                    if moderation_writer is None:
+                        moderation_writer = pq.ParquetWriter(moderation_tmp_path, rects.schema, compression=compression)
+                    moderation_writer.write_table(rects)
+            if transform is not None:
+                table = transform(table)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema, compression=compression)
+            pending.append(table)
+            pending_rows += table.num_rows
+
+            if pending_rows >= row_group_size:
+                table = pa.concat_tables(pending)
+                full = pending_rows - pending_rows % row_group_size
+                write(table.slice(0, full))
+                pending = [table.slice(full)]
+                pending_rows -= full
+                total_rows += full
+
+        if pending_rows:
+            write(pa.concat_tables(pending))
+            total_rows += pending_rows
+        while writes:
+            writes.popleft().result()
+    except BaseException:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        # Writers are closed before their tmp files are removed, so no
+        # footer is flushed into an unlinked file
+        for open_writer in (writer, quarantine_writer, moderation_writer):
+            if open_writer is not None:
+                open_writer.close()
+        for path in (tmp_path, quarantine_tmp_path, moderation_tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        batches.close()
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if moderation_writer is not None:
+            moderation_writer.close()
+        if quarantine_writer is not None:
+            quarantine_writer.close()
+
+    if writer is None:
+        for path in (quarantine_tmp_path, moderation_tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise ValueError(f"No rows found in {gzip_path}")
+    writer.close()
+    if compact:
+        write_palette(palette, parquet_path)
+        _write_quality_report(gzip_path, parquet_path, read_rows, rect_rows, rejected_counts)
+        if quarantine_writer is not None:
+            os.replace(quarantine_tmp_path, quarantine_path(parquet_path))
+        elif os.path.exists(quarantine_path(parquet_path)):
+            os.remove(quarantine_path(parquet_path))
+        if moderation_writer is not None:
+            os.replace(moderation_tmp_path, moderation_path(parquet_path))
+        elif os.path.exists(moderation_path(parquet_path)):
+            os.remove(moderation_path(parquet_path))
+    os.replace(tmp_path, parquet_path)
+
+    seconds = (perf_counter_ns() - start_timer) / 1e9
+    stats = {
+        "rows": total_rows,
+        "seconds": seconds,
+        "rows_per_second": total_rows / seconds if seconds else 0.0,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    print(f"Converted {total_rows:,} rows in {seconds:.1f} s "
+          f"({stats['rows_per_second']:,.0f} rows/s, peak RSS {format_bytes(stats['peak_rss_bytes'])})")
+    return stats
+
+def _write_quality_report(gzip_path, parquet_path, read_rows, rect_rows, rejected_counts):
+    rejected = sum(rejected_counts.values())
+    report = {
+        "source": gzip_path,
+        "rows": read_rows,
+        "pixels": read_rows - rejected - rect_rows,
+        "moderation_rects": rect_rows,
+        "rejected": rejected,
+        "rejected_by_reason": rejected_counts,
+    }
+    with open(quality_report_path(parquet_path), "w") as file:
+        json.dump(report, file, indent=2)
+    if rejected:
+        reasons = ", ".join(f"{reason}: {count:,}" for reason, count in rejected_counts.items() if count)
+        print(f"Quarantined {rejected:,} of {read_rows:,} rows ({reasons}) to {quarantine_path(parquet_path)}")
+
+def ensure_compact(gzip_path, parquet_path, columns=CANVAS_COLUMNS):
+    if is_compact(parquet_path):
+        print("Parquet file already exists. Skipping conversion.")
+    else:
+        print("Converting gzip to parquet...")
+        convert_gzip_to_parquet(gzip_path, parquet_path, columns=columns, compact=True)
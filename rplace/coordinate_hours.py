@@ -0,0 +1,57 @@
+from rplace.dataset import HOUR_MS
+from rplace.db import DB_PATH, connect
+
+# Per-window aggregate of a canvas table for the W4 analyses:
+#   <table>_coord_hours_<start_ms>_<end_ms>  hour, x, y, pixel_color, placements
+# over the placements in [start_ms, end_ms), with `hour` in epoch ms. It is
+# built with one scan of the window and kept in the database, so every W4
+# query is a small GROUP BY over it. Each window has its own table, tracked
+# in _sources with the fingerprint of the base table's source; tables built
+# from an older source are dropped when a new one is built.
+
+def coordinate_hours_table(table, start_ms, end_ms):
+    return f"{table}_coord_hours_{start_ms}_{end_ms}"
+
+def _fingerprint(con, name):
+    row = con.execute("SELECT fingerprint FROM _sources WHERE name = ?", [name]).fetchone()
+    return row[0] if row else None
+
+def build_coordinate_hours(table, start_ms, end_ms, db_path=DB_PATH):
+    con = connect(db_path)
+    fingerprint = _fingerprint(con, table)
+    if fingerprint is None:
+        raise ValueError(f"{table} was not loaded with load_canvas")
+
+    aggregate = coordinate_hours_table(table, start_ms, end_ms)
+    stale = con.execute(
+        "SELECT name FROM _sources WHERE path = ? AND name LIKE ? AND fingerprint <> ?",
+        [table, f"{table}_coord_hours_%", fingerprint],
+    ).fetchall()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for (name,) in stale:
+            con.execute(f"DROP TABLE IF EXISTS {name}")
+            con.execute("DELETE FROM _sources WHERE name = ?", [name])
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {aggregate} AS
+            SELECT timestamp // {HOUR_MS} * {HOUR_MS} AS hour, x, y, pixel_color, COUNT(*) AS placements
+            FROM {table}
+            WHERE timestamp >= {start_ms} AND timestamp < {end_ms}
+            GROUP BY ALL
+            ORDER BY hour, x, y
+        """)
+        con.execute("INSERT OR REPLACE INTO _sources VALUES (?, ?, ?)", [aggregate, table, fingerprint])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return aggregate
+
+def ensure_coordinate_hours(table, start_ms, end_ms, db_path=DB_PATH):
+    con = connect(db_path)
+    aggregate = coordinate_hours_table(table, start_ms, end_ms)
+    fingerprint = _fingerprint(con, table)
+    if fingerprint is None or _fingerprint(con, aggregate) != fingerprint:
+        print(f"Building {aggregate}...")
+        build_coordinate_hours(table, start_ms, end_ms, db_path)
+    return aggregate
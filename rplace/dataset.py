@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from rplace.schema import is_compact, moderation_path, palette_path
+
+# Time-partitioned layout of a compact canvas file:
+#   <dataset>/date=2022-04-01/hour=12/part-0.parquet
+# Rows inside each hour are sorted by timestamp and written in small row
+# groups with min/max statistics, so a range query touches only the hours it
+# overlaps and, inside them, only the row groups whose statistics overlap.
+# <dataset>/_source.json records the file it was partitioned from and that
+# file's fingerprint, so a regenerated file is partitioned again.
+
+HOUR_MS = 3_600_000
+SOURCE_FILE = "_source.json"
+
+def partition_dir(dataset_path, hour):
+    start = datetime(1970, 1, 1) + timedelta(hours=int(hour))
+    return os.path.join(dataset_path, f"date={start:%Y-%m-%d}", f"hour={start:%H}")
+
+def _partition_hour(date_dir, hour_dir):
+    start = datetime.strptime(f"{date_dir[5:]} {hour_dir[5:]}", "%Y-%m-%d %H")
+    return int((start - datetime(1970, 1, 1)).total_seconds()) // 3600
+
+def list_partitions(dataset_path):
+    partitions = []
+    for date_dir in sorted(os.listdir(dataset_path)):
+        if not date_dir.startswith("date="):
+            continue
+        for hour_dir in sorted(os.listdir(os.path.join(dataset_path, date_dir))):
+            if hour_dir.startswith("hour="):
+                path = os.path.join(dataset_path, date_dir, hour_dir, "part-0.parquet")
+                partitions.append((_partition_hour(date_dir, hour_dir), path))
+    return partitions
+
+# A plain Parquet file is returned as is; for a dataset only the hour
+# partitions overlapping [start_ms, end_ms) are returned. Either bound may be
+# None for an open-ended range.
+def dataset_files(path, start_ms=None, end_ms=None):
+    if not os.path.isdir(path):
+        return [path]
+    return [
+        file for hour, file in list_partitions(path)
+        if (end_ms is None or hour * HOUR_MS < end_ms) and (start_ms is None or (hour + 1) * HOUR_MS > start_ms)
+    ]
+
+# Changes whenever a file of the source (or its palette) is rewritten
+def source_fingerprint(source_path):
+    files = dataset_files(source_path)
+    if os.path.exists(palette_path(source_path)):
+        files.append(palette_path(source_path))
+    digest = hashlib.sha1()
+    for file in files:
+        stat = os.stat(file)
+        digest.update(f"{file}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+# DuckDB source expression for the files overlapping a range
+def read_parquet_sql(path, start_ms=None, end_ms=None):
+    files = dataset_files(path, start_ms, end_ms)
+    if not files:
+        # read_parquet needs at least one file; the query's own time filter
+        # still applies, so any partition yields an empty result
+        files = dataset_files(path)[:1]
+    return "read_parquet([" + ", ".join(f"'{file}'" for file in files) + "])"
+
+# (file, row group) pairs whose timestamp statistics overlap [start_ms, end_ms)
+def row_groups_in_range(path, start_ms=None, end_ms=None):
+    selected = []
+    for file in dataset_files(path, start_ms, end_ms):
+        metadata = pq.ParquetFile(file).metadata
+        ts_index = metadata.schema.to_arrow_schema().get_field_index("timestamp")
+        for i in range(metadata.num_row_groups):
+            stats = metadata.row_group(i).column(ts_index).statistics
+            if stats is not None and stats.has_min_max:
+                if (end_ms is not None and stats.min >= end_ms) or (start_ms is not None and stats.max < start_ms):
+                    continue
+            selected.append((file, i))
+    return selected
+
+def write_partitioned(parquet_path, dataset_path, row_group_size=128_000, compression="snappy"):
+    tmp_path = f"{dataset_path}.tmp"
+    staging_path = os.path.join(tmp_path, "_staging")
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(staging_path)
+
+    # Pass 1: route every row group to a per-hour staging file. Only one row
+    # group is in memory at a time; rows without a timestamp cannot be placed
+    # in any partition and are dropped.
+    parquet_file = pq.ParquetFile(parquet_path)
+    writers = {}
+    dropped = 0
+    try:
+        for i in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(i)
+            dropped += table.column("timestamp").null_count
+            table = table.filter(pc.is_valid(table.column("timestamp")))
+
+            hours = pc.divide(table.column("timestamp"), HOUR_MS).to_numpy()
+            order = np.argsort(hours, kind="stable")
+            table = table.take(pa.array(order))
+            hours = hours[order]
+
+            bounds = np.flatnonzero(np.diff(hours)) + 1
+            for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(hours)]))):
+                hour = int(hours[start])
+                if hour not in writers:
+                    writers[hour] = pq.ParquetWriter(os.path.join(staging_path, f"{hour}.parquet"), table.schema)
+                writers[hour].write_table(table.slice(start, end - start))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    # Pass 2: sort each hour by time and rewrite it with small row groups
+    for hour in sorted(writers):
+        staging_file = os.path.join(staging_path, f"{hour}.parquet")
+        table = pq.read_table(staging_file).sort_by("timestamp")
+        out_dir = partition_dir(tmp_path, hour)
+        os.makedirs(out_dir, exist_ok=True)
+        pq.write_table(table, os.path.join(out_dir, "part-0.parquet"),
+                       row_group_size=row_group_size, compression=compression, write_statistics=True)
+        os.remove(staging_file)
+
+    shutil.rmtree(staging_path)
+    with open(os.path.join(tmp_path, SOURCE_FILE), "w") as file:
+        json.dump({"source": parquet_path, "source_fingerprint": source_fingerprint(parquet_path)}, file)
+    if os.path.exists(dataset_path):
+        shutil.rmtree(dataset_path)
+    os.replace(tmp_path, dataset_path)
+
+    # Side tables are shared when the dataset is named after the file's stem;
+    # otherwise they are copied, and a copy the file no longer has is removed
+    for side_path in (palette_path, moderation_path):
+        if side_path(parquet_path) == side_path(dataset_path):
+            continue
+        if os.path.exists(side_path(parquet_path)):
+            shutil.copyfile(side_path(parquet_path), side_path(dataset_path))
+        elif os.path.exists(side_path(dataset_path)):
+            os.remove(side_path(dataset_path))
+
+    print(f"Wrote {len(writers)} hourly partitions to {dataset_path}" + (f" ({dropped} rows without timestamp dropped)" if dropped else ""))
+
+# True when `dataset_path` holds the partitions of the current `parquet_path`
+def is_partitioned(parquet_path, dataset_path):
+    if not is_compact(dataset_path) or not os.path.exists(os.path.join(dataset_path, SOURCE_FILE)):
+        return False
+    with open(os.path.join(dataset_path, SOURCE_FILE)) as file:
+        meta = json.load(file)
+    return meta["source_fingerprint"] == source_fingerprint(parquet_path)
+
+def ensure_partitioned(parquet_path, dataset_path):
+    if not is_partitioned(parquet_path, dataset_path):
+        print("Partitioning parquet by hour...")
+        write_partitioned(parquet_path, dataset_path)
@@ -0,0 +1,65 @@
+import os
+import duckdb
+
+from rplace.dataset import dataset_files, source_fingerprint
+from rplace.schema import palette_path
+
+# Persistent DuckDB database holding canvas tables loaded once from Parquet.
+# Each table is stored sorted by timestamp with typed columns, so DuckDB's
+# per-block min/max (zone maps) skip everything outside a time filter. A
+# table is reloaded only when the files it was loaded from change.
+
+DB_PATH = "rplace.duckdb"
+
+_connections = {}
+
+# One connection per database file, shared by every module in the process
+def connect(db_path=DB_PATH):
+    if db_path not in _connections:
+        _connections[db_path] = duckdb.connect(db_path)
+    return _connections[db_path]
+
+def _select_typed(con, source):
+    types = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM {source})").fetchall())
+    if types["timestamp"] == "BIGINT":
+        return f"SELECT * FROM {source}"
+
+    # Raw layout: epoch-ms timestamps and x, y like the compact layout, with
+    # moderator rectangles ("x1,y1,x2,y2") left without a pixel coordinate.
+    # Malformed timestamps become NULL, and load_canvas drops those rows.
+    columns = [name for name in types if name not in ("timestamp", "coordinate")]
+    typed = ["epoch_ms(TRY_CAST(regexp_replace(timestamp, ' UTC$', '') AS TIMESTAMP)) AS timestamp"] + columns
+    if "coordinate" in types:
+        typed += [
+            f"CASE WHEN coordinate LIKE '%,%,%' THEN NULL ELSE TRY_CAST(split_part(coordinate, ',', {i}) AS USMALLINT) END AS {name}"
+            for i, name in ((1, "x"), (2, "y"))
+        ]
+    return f"SELECT {', '.join(typed)} FROM {source}"
+
+# Loads `source_path` (a Parquet file or hour-partitioned dataset) into
+# `table`, plus its palette into `<table>_palette`, unless already current
+def load_canvas(source_path, table="canvas", db_path=DB_PATH):
+    con = connect(db_path)
+    con.execute("CREATE TABLE IF NOT EXISTS _sources (name VARCHAR PRIMARY KEY, path VARCHAR, fingerprint VARCHAR)")
+
+    fingerprint = source_fingerprint(source_path)
+    loaded = con.execute("SELECT fingerprint FROM _sources WHERE name = ?", [table]).fetchone()
+    if loaded is not None and loaded[0] == fingerprint:
+        return con
+
+    print(f"Loading {source_path} into {db_path}:{table}...")
+    source = "read_parquet([" + ", ".join(f"'{file}'" for file in dataset_files(source_path)) + "])"
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM ({_select_typed(con, source)}) WHERE timestamp IS NOT NULL ORDER BY timestamp")
+        dropped = con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0] - con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if dropped:
+            print(f"Dropped {dropped:,} rows without a valid timestamp from {source_path}")
+        if os.path.exists(palette_path(source_path)):
+            con.execute(f"CREATE OR REPLACE TABLE {table}_palette AS SELECT * FROM read_parquet('{palette_path(source_path)}')")
+        con.execute("INSERT OR REPLACE INTO _sources VALUES (?, ?, ?)", [table, source_path, fingerprint])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return con
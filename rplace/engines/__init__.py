@@ -0,0 +1,37 @@
+import importlib
+
+# Every engine answers "most placed color and pixel in [start, end)" from the
+# same canvas gzip file and exposes two functions:
+#   prepare(gzip_path) -> source
+#       builds, once, whatever layout the engine reads (gzip index, compact
+#       Parquet, hourly dataset, DuckDB table) and returns it
+#   most_placed(source, start_time, end_time) -> (color, coordinate)
+#       "None" stands in for either value when the range is empty
+# Modules are imported on first use, so choosing one engine does not load
+# the libraries of the others.
+
+ENGINES = {
+    "python": "rplace.engines.python_engine",
+    "pandas": "rplace.engines.pandas_engine",
+    "polars": "rplace.engines.polars_engine",
+    "duckdb": "rplace.engines.duckdb_engine",
+    "rollup": "rplace.engines.rollup_engine",
+}
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name} (expected one of {', '.join(ENGINES)})")
+    return importlib.import_module(ENGINES[name])
+
+# 2022_place_canvas_history.csv.gzip -> (2022_place_canvas_history.parquet,
+# 2022_place_canvas_history), next to the gzip file
+def canvas_paths(gzip_path):
+    stem = gzip_path
+    for suffix in (".gzip", ".gz", ".csv"):
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+    return f"{stem}.parquet", stem
+
+def most_placed(name, gzip_path, start_time, end_time):
+    engine = get_engine(name)
+    return engine.most_placed(engine.prepare(gzip_path), start_time, end_time)
@@ -0,0 +1,57 @@
+from rplace.convert import ensure_compact
+from rplace.db import connect, load_canvas
+from rplace.engines import canvas_paths
+from rplace.timestamps import to_epoch_ms
+
+def process_parquet_with_duckdb(table, start_time, end_time):
+    start_ms = to_epoch_ms(start_time)
+    end_ms = to_epoch_ms(end_time)
+
+    query_pixel_color = f"""
+    SELECT 
+        palette.hex AS pixel_color,
+        counts.color_count
+    FROM (
+        SELECT pixel_color, COUNT(*) AS color_count
+        FROM {table}
+        WHERE 
+            timestamp >= {start_ms}
+            AND timestamp < {end_ms}
+            AND pixel_color IS NOT NULL
+        GROUP BY pixel_color
+    ) counts
+    JOIN {table}_palette palette USING (pixel_color)
+    ORDER BY color_count DESC
+    """
+
+    query_coordinate = f"""
+        SELECT 
+            x || ',' || y AS coordinate,
+            COUNT(*) AS coordinate_count
+        FROM {table}
+        WHERE 
+            timestamp >= {start_ms}
+            AND timestamp < {end_ms}
+            AND x IS NOT NULL
+        GROUP BY x, y
+        ORDER BY coordinate_count DESC
+    """
+
+    con = connect()
+    result_pixel_color = con.query(query_pixel_color).to_df()
+
+    result_coordinate = con.query(query_coordinate).to_df()
+
+    most_place_pixel_color = result_pixel_color.iloc[0]['pixel_color'] if not result_pixel_color.empty else "None"
+    most_placed_pixel = result_coordinate.iloc[0]['coordinate'] if not result_coordinate.empty else "None"
+
+    return most_place_pixel_color, most_placed_pixel
+
+def prepare(gzip_path):
+    parquet_path, _ = canvas_paths(gzip_path)
+    ensure_compact(gzip_path, parquet_path)
+    load_canvas(parquet_path, "canvas")
+    return "canvas"
+
+def most_placed(source, start_time, end_time):
+    return process_parquet_with_duckdb(source, start_time, end_time)
@@ -0,0 +1,66 @@
+import pandas as pd
+from multiprocessing import Pool, cpu_count
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from rplace.convert import ensure_compact
+from rplace.dataset import ensure_partitioned, row_groups_in_range
+from rplace.engines import canvas_paths
+from rplace.schema import format_coordinate, read_palette
+from rplace.timestamps import to_epoch_ms
+
+def merge_results(results):
+    pixel_color_count = pd.concat([pixel_color_result for pixel_color_result, _ in results]).groupby(level=0).sum()
+    coordinate_count = pd.concat([coordinate_result for _, coordinate_result in results]).groupby(level=0).sum()
+    return pixel_color_count, coordinate_count
+
+# Map step: filter one row group in Arrow before converting to pandas and
+# return only its two count vectors
+def read_and_process_chunk(row_group_idx, file_path, start_ms, end_ms):
+
+    parquet_file = pq.ParquetFile(file_path)
+    table = parquet_file.read_row_group(row_group_idx, columns=["timestamp", "pixel_color", "x", "y"])
+
+    timestamps = table.column('timestamp')
+    table = table.filter(pc.and_(pc.greater_equal(timestamps, start_ms), pc.less(timestamps, end_ms)))
+    chunk = table.drop_null().to_pandas()
+
+    # Pack x/y into one integer key so value_counts works on a single column
+    pixel_color_count = chunk['pixel_color'].value_counts()
+    coordinate_count = (chunk['x'].astype('uint32') * 65536 + chunk['y'].astype('uint32')).value_counts()
+
+    return pixel_color_count, coordinate_count
+
+def process_parquet(file_path, start_time, end_time):
+    start_ms = to_epoch_ms(start_time)
+    end_ms = to_epoch_ms(end_time)
+
+    # Only partitions and row groups whose timestamp range overlaps the query
+    row_groups = row_groups_in_range(file_path, start_ms, end_ms)
+    if not row_groups:
+        return "None", "None"
+
+    with Pool(cpu_count()) as pool:
+        chunk_results = pool.starmap(
+            read_and_process_chunk,
+            [(i, row_group_file, start_ms, end_ms) for row_group_file, i in row_groups]
+        )
+
+    pixel_color_count, coordinate_count = merge_results(chunk_results)
+    if pixel_color_count.empty:
+        return "None", "None"
+
+    palette = read_palette(file_path)
+    most_place_pixel_color = palette[int(pixel_color_count.idxmax())]
+    most_placed_pixel = format_coordinate(*divmod(int(coordinate_count.idxmax()), 65536))
+
+    return most_place_pixel_color, most_placed_pixel
+
+def prepare(gzip_path):
+    parquet_path, dataset_path = canvas_paths(gzip_path)
+    ensure_compact(gzip_path, parquet_path)
+    ensure_partitioned(parquet_path, dataset_path)
+    return dataset_path
+
+def most_placed(source, start_time, end_time):
+    return process_parquet(source, start_time, end_time)
@@ -0,0 +1,70 @@
+import polars as pl
+
+from rplace.convert import ensure_compact
+from rplace.dataset import dataset_files, ensure_partitioned
+from rplace.engines import canvas_paths
+from rplace.schema import format_coordinate, read_palette
+from rplace.timestamps import to_epoch_ms
+
+def process_parquet_with_polars(file_path, start_time, end_time):
+    start_ms = to_epoch_ms(start_time)
+    end_ms = to_epoch_ms(end_time)
+
+    files = dataset_files(file_path, start_ms, end_ms)
+    if not files:
+        return "None", "None"
+
+    df = pl.scan_parquet(files)
+    if df.collect_schema()["timestamp"] == pl.String:
+        # Raw layout: "YYYY-MM-DD HH:MM:SS[.fff] UTC" sorts like the time it
+        # encodes, so the window is a plain string comparison with no parsing
+        time_filter = (
+            (pl.col("timestamp") >= f"{start_time:%Y-%m-%d %H:%M:%S}") &
+            (pl.col("timestamp") < f"{end_time:%Y-%m-%d %H:%M:%S}")
+        )
+        coordinate_columns = ["coordinate"]
+        palette = None
+    else:
+        time_filter = (pl.col("timestamp") >= start_ms) & (pl.col("timestamp") < end_ms)
+        coordinate_columns = ["x", "y"]
+        palette = read_palette(file_path)
+
+    filtered_df = df.filter(
+        time_filter &
+        (pl.col("pixel_color").is_not_null()) &
+        (pl.col(coordinate_columns[0]).is_not_null())
+    )
+
+    # Both aggregates share one scan of the filtered rows
+    pixel_color_counts, coordinate_counts = pl.collect_all(
+        [
+            filtered_df.group_by("pixel_color").agg(pl.len().alias("color_count")).top_k(1, by="color_count"),
+            filtered_df.group_by(coordinate_columns).agg(pl.len().alias("coordinate_count")).top_k(1, by="coordinate_count"),
+        ],
+        engine="streaming",
+    )
+
+    # Most frequent pixel color and coordinate
+    most_place_pixel_color = "None"
+    if len(pixel_color_counts) > 0:
+        most_place_pixel_color = pixel_color_counts[0, "pixel_color"]
+        if palette is not None:
+            most_place_pixel_color = palette[most_place_pixel_color]
+
+    most_placed_pixel = "None"
+    if len(coordinate_counts) > 0:
+        if palette is None:
+            most_placed_pixel = coordinate_counts[0, "coordinate"]
+        else:
+            most_placed_pixel = format_coordinate(coordinate_counts[0, "x"], coordinate_counts[0, "y"])
+
+    return most_place_pixel_color, most_placed_pixel
+
+def prepare(gzip_path):
+    parquet_path, dataset_path = canvas_paths(gzip_path)
+    ensure_compact(gzip_path, parquet_path)
+    ensure_partitioned(parquet_path, dataset_path)
+    return dataset_path
+
+def most_placed(source, start_time, end_time):
+    return process_parquet_with_polars(source, start_time, end_time)
@@ -0,0 +1,204 @@
+import csv
+import gzip
+import io
+import queue
+from multiprocessing import Process, Queue, cpu_count
+
+from rplace.gzindex import build_index, load_index, read_range, save_index
+from rplace.sketches import HeavyHitters
+from rplace.timestamps import parse_timestamp, to_epoch_ms
+
+# How long a blocked put or get waits before checking on the workers
+POLL_SECONDS = 0.5
+
+def process_chunk(chunk, start_ms, end_ms, color_count=None, pixel_coordinate_count=None):
+    if color_count is None:
+        color_count = {}
+    if pixel_coordinate_count is None:
+        pixel_coordinate_count = {}
+
+    for row in chunk:
+        try:
+            timestamp = parse_timestamp(row[0])
+        except ValueError:
+            continue
+
+        if start_ms <= timestamp < end_ms:
+            color = row[2]
+            pixel_coordinate = row[3]
+
+            color_count[color] = color_count.get(color, 0) + 1
+            pixel_coordinate_count[pixel_coordinate] = pixel_coordinate_count.get(pixel_coordinate, 0) + 1
+
+    return color_count, pixel_coordinate_count
+
+# Merge results from workers
+def merge_results(results):
+    color_count = {}
+    pixel_coordinate_count = {}
+
+    for color_result, pixel_result in results:
+        for color, count in color_result.items():
+            color_count[color] = color_count.get(color, 0) + count
+        for pixel, count in pixel_result.items():
+            pixel_coordinate_count[pixel] = pixel_coordinate_count.get(pixel, 0) + count
+
+    return color_count, pixel_coordinate_count
+
+# Split the decompressed stream into blocks of whole lines
+def read_chunks(file, chunk_bytes):
+    remainder = b""
+    while True:
+        block = file.read(chunk_bytes)
+        if not block:
+            break
+        block = remainder + block
+        cut = block.rfind(b"\n") + 1
+        remainder = block[cut:]
+        if cut:
+            yield block[:cut]
+    if remainder:
+        yield remainder
+
+# Long-lived worker: counts every chunk it receives into local counters
+# and sends them back once, when it sees the end-of-input sentinel. With a
+# gzip index the queue carries checkpoint numbers and each worker inflates
+# its own slice of the file instead of receiving raw bytes. With top_k set,
+# each chunk's counts are folded into fixed-size sketches instead of
+# growing dicts. An exception is sent back instead of the counts, to be
+# re-raised by run_workers.
+def count_worker(chunk_queue, result_queue, start_ms, end_ms, gzip_path=None, top_k=None):
+    try:
+        color_count = {}
+        pixel_coordinate_count = {}
+        if top_k is not None:
+            color_count = HeavyHitters(top_k, width=1024)
+            pixel_coordinate_count = HeavyHitters(top_k)
+        points = load_index(gzip_path) if gzip_path else None
+
+        while True:
+            task = chunk_queue.get()
+            if task is None:
+                break
+            chunks = [task] if points is None else read_range(gzip_path, points, task, task + 1)
+            for chunk in chunks:
+                rows = csv.reader(io.StringIO(chunk.decode("utf-8")))
+                # Slice 0 starts with the header row, which fails timestamp parsing
+                if top_k is None:
+                    process_chunk(rows, start_ms, end_ms, color_count, pixel_coordinate_count)
+                else:
+                    chunk_color_count, chunk_pixel_count = process_chunk(rows, start_ms, end_ms)
+                    color_count.update(chunk_color_count)
+                    pixel_coordinate_count.update(chunk_pixel_count)
+    except Exception as error:
+        result_queue.put(("error", error))
+        return
+
+    result_queue.put(("counts", (color_count, pixel_coordinate_count)))
+
+def run_workers(file_path, start_time, end_time, chunk_bytes, num_workers, queue_depth, use_index, top_k=None):
+    num_workers = num_workers or cpu_count()
+    start_ms = to_epoch_ms(start_time)
+    end_ms = to_epoch_ms(end_time)
+
+    points = load_index(file_path) if use_index else None
+    if use_index and points is None:
+        raise ValueError(f"No up-to-date gzip index for {file_path}")
+
+    # Bounded so the reader can only run a few chunks ahead of the workers
+    chunk_queue = Queue(maxsize=num_workers * queue_depth)
+    result_queue = Queue()
+
+    worker_args = (chunk_queue, result_queue, start_ms, end_ms, file_path if use_index else None, top_k)
+    workers = [Process(target=count_worker, args=worker_args, daemon=True) for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    results = []
+
+    # Waits up to `timeout` for the next result. A worker's exception is
+    # re-raised here, and a worker that died without sending anything
+    # (killed, crashed) fails the run, so the parent never blocks on a
+    # queue that no worker serves.
+    def collect(timeout):
+        try:
+            kind, value = result_queue.get(timeout=timeout)
+        except queue.Empty:
+            for worker in workers:
+                if worker.exitcode not in (None, 0):
+                    raise RuntimeError(f"Worker {worker.pid} exited with code {worker.exitcode}")
+            return
+        if kind == "error":
+            raise value
+        results.append(value)
+
+    def put(task):
+        while True:
+            collect(0)
+            try:
+                chunk_queue.put(task, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    try:
+        if use_index:
+            for checkpoint in range(len(points)):
+                put(checkpoint)
+        else:
+            with gzip.open(file_path, mode='rb') as file:
+                file.readline() # Skip header
+                for chunk in read_chunks(file, chunk_bytes):
+                    put(chunk)
+        for _ in workers:
+            put(None)
+
+        # Drain results before joining so workers can flush their queues
+        while len(results) < len(workers):
+            collect(POLL_SECONDS)
+    except BaseException:
+        for worker in workers:
+            worker.terminate()
+        raise
+
+    for worker in workers:
+        worker.join()
+
+    return results
+
+def process_csv(file_path, start_time, end_time, chunk_bytes=16 * 1024**2, num_workers=None, queue_depth=2, use_index=False):
+    results = run_workers(file_path, start_time, end_time, chunk_bytes, num_workers, queue_depth, use_index)
+    color_count, pixel_coordinate_count = merge_results(results)
+
+    # Results
+    most_place_color = max(color_count, key=color_count.get, default="None")
+    most_placed_pixel = max(pixel_coordinate_count, key=pixel_coordinate_count.get, default="None")
+
+    return most_place_color, most_placed_pixel
+
+# Approximate mode: returns (key, lower bound, upper bound) for the most
+# placed color and pixel, or None when the range is empty
+def process_csv_topk(file_path, start_time, end_time, top_k=1000, chunk_bytes=16 * 1024**2, num_workers=None, queue_depth=2, use_index=False):
+    results = run_workers(file_path, start_time, end_time, chunk_bytes, num_workers, queue_depth, use_index, top_k)
+
+    color_sketch, pixel_sketch = results[0]
+    for other_color_sketch, other_pixel_sketch in results[1:]:
+        color_sketch.merge(other_color_sketch)
+        pixel_sketch.merge(other_pixel_sketch)
+
+    return color_sketch.most_frequent(), pixel_sketch.most_frequent()
+
+def format_estimate(estimate):
+    if estimate is None:
+        return "None"
+    key, lower, upper = estimate
+    return f"{key} ({lower}-{upper} placements)" if lower != upper else f"{key} ({lower} placements)"
+
+def prepare(gzip_path):
+    if load_index(gzip_path) is None:
+        print("Indexing gzip file...")
+        save_index(gzip_path, build_index(gzip_path))
+    return gzip_path
+
+def most_placed(source, start_time, end_time):
+    return process_csv(source, start_time, end_time, use_index=True)
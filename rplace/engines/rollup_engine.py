@@ -0,0 +1,25 @@
+from rplace.convert import ensure_compact
+from rplace.dataset import HOUR_MS, ensure_partitioned
+from rplace.engines import canvas_paths
+from rplace.engines.polars_engine import process_parquet_with_polars
+from rplace.pixel_counts import ensure_pixel_counts, most_placed_pixel
+from rplace.rollup import ensure_rollup, is_hour_aligned, most_placed_color
+from rplace.timestamps import to_epoch_ms
+
+def prepare(gzip_path):
+    parquet_path, dataset_path = canvas_paths(gzip_path)
+    ensure_compact(gzip_path, parquet_path)
+    ensure_partitioned(parquet_path, dataset_path)
+    ensure_rollup(dataset_path)
+    ensure_pixel_counts(dataset_path)
+    return dataset_path
+
+# Hour-aligned ranges come from the color rollup and the per-pixel counts;
+# anything finer scans the hourly dataset
+def most_placed(source, start_time, end_time):
+    if not (is_hour_aligned(start_time) and is_hour_aligned(end_time)):
+        return process_parquet_with_polars(source, start_time, end_time)
+
+    start_hour = to_epoch_ms(start_time) // HOUR_MS
+    end_hour = to_epoch_ms(end_time) // HOUR_MS
+    return most_placed_color(source, start_hour, end_hour), most_placed_pixel(source, start_hour, end_hour)
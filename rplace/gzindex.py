@@ -0,0 +1,241 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+# Random access into a single-member gzip file, following zlib's zran.c.
+# One serial pass records an inflate checkpoint at a deflate block boundary
+# roughly every `span` bytes of output: the compressed offset, the bit
+# offset inside that byte, the 32 KB of output preceding it (the inflate
+# window) and the number of lines before it. Any checkpoint can then be
+# resumed on its own, so N readers can decompress N slices in parallel.
+
+WINSIZE = 32768
+CHUNK = 256 * 1024
+INDEX_MAGIC = b"GZIDX1\n"
+
+Z_OK = 0
+Z_STREAM_END = 1
+Z_NO_FLUSH = 0
+Z_BLOCK = 5
+
+Checkpoint = namedtuple("Checkpoint", ["out", "inp", "bits", "rows", "line_start", "window"])
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ("next_in", ctypes.c_void_p),
+        ("avail_in", ctypes.c_uint),
+        ("total_in", ctypes.c_ulong),
+        ("next_out", ctypes.c_void_p),
+        ("avail_out", ctypes.c_uint),
+        ("total_out", ctypes.c_ulong),
+        ("msg", ctypes.c_char_p),
+        ("state", ctypes.c_void_p),
+        ("zalloc", ctypes.c_void_p),
+        ("zfree", ctypes.c_void_p),
+        ("opaque", ctypes.c_void_p),
+        ("data_type", ctypes.c_int),
+        ("adler", ctypes.c_ulong),
+        ("reserved", ctypes.c_ulong),
+    ]
+
+_libz = None
+
+def _zlib():
+    global _libz
+    if _libz is None:
+        name = ctypes.util.find_library("z") or ("zlib1.dll" if sys.platform == "win32" else "libz.so.1")
+        _libz = ctypes.CDLL(name)
+        _libz.zlibVersion.restype = ctypes.c_char_p
+    return _libz
+
+def _inflate_init(strm, window_bits):
+    libz = _zlib()
+    ret = libz.inflateInit2_(ctypes.byref(strm), window_bits, libz.zlibVersion(), ctypes.sizeof(_ZStream))
+    if ret != Z_OK:
+        raise RuntimeError(f"inflateInit2 failed: {ret}")
+
+def _check(ret, strm):
+    if ret not in (Z_OK, Z_STREAM_END):
+        message = strm.msg.decode() if strm.msg else ret
+        raise ValueError(f"Corrupt gzip data: {message}")
+
+def index_path(gzip_path):
+    return f"{gzip_path}.idx"
+
+def build_index(gzip_path, span=32 * 1024**2):
+    libz = _zlib()
+    strm = _ZStream()
+    _inflate_init(strm, 47) # 32 + 15: gzip or zlib header, 32 KB window
+
+    in_buf = ctypes.create_string_buffer(CHUNK)
+    window = ctypes.create_string_buffer(WINSIZE)
+    window_addr = ctypes.addressof(window)
+
+    points = []
+    totin = totout = 0
+    last = -span
+    rows = 0
+    ret = Z_OK
+
+    try:
+        with open(gzip_path, "rb") as file:
+            while ret != Z_STREAM_END:
+                data = file.read(CHUNK)
+                if not data:
+                    raise ValueError(f"Unexpected end of gzip file: {gzip_path}")
+                ctypes.memmove(in_buf, data, len(data))
+                strm.next_in = ctypes.addressof(in_buf)
+                strm.avail_in = len(data)
+
+                while strm.avail_in:
+                    if strm.avail_out == 0:
+                        strm.avail_out = WINSIZE
+                        strm.next_out = window_addr
+                    out_start = WINSIZE - strm.avail_out
+
+                    totin += strm.avail_in
+                    totout += strm.avail_out
+                    ret = libz.inflate(ctypes.byref(strm), Z_BLOCK)
+                    totin -= strm.avail_in
+                    totout -= strm.avail_out
+                    _check(ret, strm)
+
+                    rows += ctypes.string_at(window_addr + out_start, WINSIZE - strm.avail_out - out_start).count(b"\n")
+                    if ret == Z_STREAM_END:
+                        break
+
+                    # Bit 7: stopped at a block boundary, bit 6: after the last block
+                    at_block = strm.data_type & 128 and not strm.data_type & 64
+                    if at_block and totout - last >= span:
+                        # Unroll the circular window so it ends at `totout`
+                        used = WINSIZE - strm.avail_out
+                        history = window.raw[used:] + window.raw[:used] if totout >= WINSIZE else window.raw[:used]
+                        line_start = totout == 0 or history[-1:] == b"\n"
+                        points.append(Checkpoint(totout, totin, strm.data_type & 7, rows, line_start, history))
+                        last = totout
+    finally:
+        libz.inflateEnd(ctypes.byref(strm))
+
+    return points
+
+def save_index(gzip_path, points):
+    stat = os.stat(gzip_path)
+    with open(index_path(gzip_path), "wb") as file:
+        file.write(INDEX_MAGIC)
+        file.write(struct.pack("<qqq", stat.st_size, stat.st_mtime_ns, len(points)))
+        for point in points:
+            window = zlib.compress(point.window)
+            file.write(struct.pack("<qqBq?q", point.out, point.inp, point.bits, point.rows, point.line_start, len(window)))
+            file.write(window)
+
+# Returns None when no index exists or the gzip file changed since indexing
+def load_index(gzip_path):
+    path = index_path(gzip_path)
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(gzip_path)
+    with open(path, "rb") as file:
+        if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            return None
+        size, mtime_ns, count = struct.unpack("<qqq", file.read(24))
+        if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return None
+
+        points = []
+        record = struct.Struct("<qqBq?q")
+        for _ in range(count):
+            out, inp, bits, rows, line_start, length = record.unpack(file.read(record.size))
+            points.append(Checkpoint(out, inp, bits, rows, line_start, zlib.decompress(file.read(length))))
+    return points
+
+def _inflate_from(gzip_path, point):
+    libz = _zlib()
+    strm = _ZStream()
+    _inflate_init(strm, -15) # Raw deflate, resumed mid-stream
+
+    in_buf = ctypes.create_string_buffer(CHUNK)
+    out_buf = ctypes.create_string_buffer(CHUNK)
+
+    try:
+        with open(gzip_path, "rb") as file:
+            file.seek(point.inp - (1 if point.bits else 0))
+            if point.bits:
+                byte = file.read(1)[0]
+                libz.inflatePrime(ctypes.byref(strm), point.bits, byte >> (8 - point.bits))
+            if point.window:
+                libz.inflateSetDictionary(ctypes.byref(strm), point.window, len(point.window))
+
+            ret = Z_OK
+            while ret != Z_STREAM_END:
+                data = file.read(CHUNK)
+                if not data:
+                    raise ValueError(f"Unexpected end of gzip file: {gzip_path}")
+                ctypes.memmove(in_buf, data, len(data))
+                strm.next_in = ctypes.addressof(in_buf)
+                strm.avail_in = len(data)
+
+                while strm.avail_in and ret != Z_STREAM_END:
+                    strm.next_out = ctypes.addressof(out_buf)
+                    strm.avail_out = CHUNK
+                    ret = libz.inflate(ctypes.byref(strm), Z_NO_FLUSH)
+                    _check(ret, strm)
+                    yield ctypes.string_at(out_buf, CHUNK - strm.avail_out)
+    finally:
+        libz.inflateEnd(ctypes.byref(strm))
+
+# Yields blocks of whole lines for every line that starts inside the output
+# range [points[first].out, points[last].out). A line crossing the end of the
+# range belongs to this range; the next range skips it.
+def read_range(gzip_path, points, first, last, chunk_bytes=16 * 1024**2):
+    point = points[first]
+    end_out = points[last].out if last < len(points) else None
+
+    block_start = point.out
+    skip = not point.line_start
+    pending = []
+    pending_len = 0
+
+    for data in _inflate_from(gzip_path, point):
+        if skip:
+            nl = data.find(b"\n")
+            if nl < 0:
+                block_start += len(data)
+                continue
+            block_start += nl + 1
+            data = data[nl + 1:]
+            skip = False
+
+        pending.append(data)
+        pending_len += len(data)
+        if end_out is not None and block_start >= end_out:
+            return
+
+        if end_out is not None and block_start + pending_len >= end_out:
+            block = b"".join(pending)
+            nl = block.find(b"\n", end_out - block_start - 1)
+            if nl >= 0:
+                yield block[:nl + 1]
+                return
+            pending = [block]
+        elif pending_len >= chunk_bytes:
+            block = b"".join(pending)
+            cut = block.rfind(b"\n") + 1
+            if cut:
+                yield block[:cut]
+            pending = [block[cut:]]
+            pending_len = len(pending[0])
+            block_start += cut
+
+    if pending_len and (end_out is None or block_start < end_out):
+        yield b"".join(pending)
+
+if __name__ == "__main__":
+    gzip_path = sys.argv[1]
+    points = build_index(gzip_path)
+    save_index(gzip_path, points)
+    print(f"Indexed {gzip_path}: {len(points)} checkpoints, {points[-1].rows if points else 0} rows before the last")
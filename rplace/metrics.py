@@ -0,0 +1,33 @@
+import sys
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# children=True reports the largest peak among waited-for child processes,
+# e.g. multiprocessing workers
+def peak_rss_bytes(children=False):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# Linux I/O counters of this process, including reaped children:
+# read_bytes is what came from storage, rchar every byte returned by read
+# calls (page cache hits included). None where /proc is unavailable.
+def io_counters():
+    try:
+        with open("/proc/self/io") as file:
+            return {key: int(value) for key, value in (line.split(": ") for line in file)}
+    except OSError:
+        return None
+
+def format_bytes(num_bytes):
+    if num_bytes is None:
+        return "n/a"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
@@ -0,0 +1,86 @@
+import json
+import os
+import numpy as np
+import pyarrow.parquet as pq
+
+from rplace.dataset import source_fingerprint
+from rplace.rollup import ensure_rollup
+from rplace.schema import CANVAS_SIZE, format_coordinate, pixel_counts_path, rollup_colors_path, rollup_coordinates_path
+
+# Per-pixel placement counts as a running total over hours, stored as one
+# .npy file of shape (hours + 1, CANVAS_SIZE, CANVAS_SIZE), uint32:
+#   counts[0]      zeros
+#   counts[k, x, y] placements at (x, y) during the first k hours
+# Counts for any hour range are one frame subtraction, and the file is opened
+# with mmap_mode="r", so processes share it through the page cache and each
+# query touches only the two frames it needs. It is built from the hourly
+# coordinate rollup; a JSON sidecar records the first hour and the source
+# fingerprint.
+
+def _meta_path(source_path):
+    return os.path.splitext(pixel_counts_path(source_path))[0] + ".json"
+
+def _read_meta(source_path):
+    if not os.path.exists(_meta_path(source_path)) or not os.path.exists(pixel_counts_path(source_path)):
+        return None
+    with open(_meta_path(source_path)) as file:
+        return json.load(file)
+
+def build_pixel_counts(source_path):
+    ensure_rollup(source_path)
+    hours = pq.read_table(rollup_colors_path(source_path), columns=["hour"]).column("hour").to_numpy()
+    first = int(hours.min()) if len(hours) else 0
+    num_hours = int(hours.max()) - first + 1 if len(hours) else 0
+
+    path = pixel_counts_path(source_path)
+    tmp_path = f"{path}.tmp.npy"
+    counts = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint32, shape=(num_hours + 1, CANVAS_SIZE, CANVAS_SIZE))
+    frame = np.zeros((CANVAS_SIZE, CANVAS_SIZE), dtype=np.uint32)
+    counts[0] = frame
+
+    for k in range(num_hours):
+        # (x, y) pairs are unique within an hour of the rollup
+        table = pq.read_table(rollup_coordinates_path(source_path), columns=["x", "y", "count"],
+                              filters=[("hour", "==", first + k)])
+        x = table.column("x").to_numpy()
+        y = table.column("y").to_numpy()
+        on_canvas = (x < CANVAS_SIZE) & (y < CANVAS_SIZE)
+        frame[x[on_canvas], y[on_canvas]] += table.column("count").to_numpy()[on_canvas]
+        counts[k + 1] = frame
+
+    counts.flush()
+    del counts
+    os.replace(tmp_path, path)
+    with open(_meta_path(source_path), "w") as file:
+        json.dump({"first_hour": first, "hours": num_hours, "source_fingerprint": source_fingerprint(source_path)}, file)
+    print(f"Wrote per-pixel counts for {num_hours} hours to {path}")
+
+def ensure_pixel_counts(source_path):
+    meta = _read_meta(source_path)
+    if meta is None or meta["source_fingerprint"] != source_fingerprint(source_path):
+        print("Building per-pixel hourly counts...")
+        build_pixel_counts(source_path)
+
+# (first hour, read-only memmap of the running totals)
+def open_pixel_counts(source_path):
+    meta = _read_meta(source_path)
+    if meta is None:
+        raise ValueError(f"No per-pixel counts for {source_path}")
+    return meta["first_hour"], np.load(pixel_counts_path(source_path), mmap_mode="r")
+
+# CANVAS_SIZE x CANVAS_SIZE placements per pixel over the hours
+# [start_hour, end_hour), indexed [x, y]
+def heatmap(source_path, start_hour, end_hour):
+    first, counts = open_pixel_counts(source_path)
+    last = len(counts) - 1
+    end = min(max(end_hour - first, 0), last)
+    start = min(max(start_hour - first, 0), end)
+    return counts[end].astype(np.int64) - counts[start]
+
+def most_placed_pixel(source_path, start_hour, end_hour):
+    counts = heatmap(source_path, start_hour, end_hour)
+    top = int(counts.argmax())
+    if counts.flat[top] == 0:
+        return "None"
+    return format_coordinate(*divmod(top, CANVAS_SIZE))
+
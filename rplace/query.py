@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rplace.db import DB_PATH, connect
+
+# Query layer over the shared DuckDB connection:
+#   - values are bound as parameters ($1 or ?), so the SQL text of a query
+#     is a constant template no matter how many values it filters on
+#   - lists of values (user ids, coordinates) are passed as `lookups`,
+#     registered as Arrow relations for the duration of the query and
+#     semi-joined, e.g. `WHERE user_id IN (SELECT value FROM bots)`,
+#     instead of being inlined into IN (...)
+#   - results are cached on disk as Parquet under query_cache/, keyed by
+#     the template, the parameters, the lookup contents and the source
+#     fingerprints of the tables the query reads, so a repeated query is a
+#     file read and any reload of those tables invalidates it
+# Results are Arrow tables.
+
+def cache_dir(db_path=DB_PATH):
+    return os.path.join(os.path.dirname(db_path), "query_cache")
+
+# A list of values becomes a one-column "value" relation; a dict of
+# columns or an Arrow table is registered as is
+def _lookup_table(values):
+    if isinstance(values, pa.Table):
+        return values
+    if isinstance(values, dict):
+        return pa.table(values)
+    return pa.table({"value": pa.array(list(values))})
+
+def _digest(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return hashlib.sha1(sink.getvalue()).hexdigest()
+
+# None when a table has no recorded source, so its results are not cached
+def _cache_key(con, sql, params, lookups, tables):
+    fingerprints = []
+    for table in tables:
+        row = con.execute("SELECT fingerprint FROM _sources WHERE name = ?", [table]).fetchone()
+        if row is None:
+            return None
+        fingerprints.append(row[0])
+    key = json.dumps({
+        "sql": sql,
+        "params": params,
+        "lookups": {name: _digest(table) for name, table in sorted(lookups.items())},
+        "sources": fingerprints,
+    }, default=str, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+# Runs `sql` with `params` bound and `lookups` (name -> values) registered.
+# `tables` names the tables in _sources the query reads (a table's palette
+# is covered by the table itself); with cache=True the result is served
+# from and stored in the query cache.
+def query(sql, params=None, lookups=None, tables=(), cache=True, db_path=DB_PATH):
+    con = connect(db_path)
+    lookups = {name: _lookup_table(values) for name, values in (lookups or {}).items()}
+
+    path = None
+    if cache:
+        key = _cache_key(con, sql, params, lookups, tables)
+        if key is not None:
+            path = os.path.join(cache_dir(db_path), f"{key}.parquet")
+            if os.path.exists(path):
+                return pq.read_table(path)
+
+    for name, table in lookups.items():
+        con.register(name, table)
+    try:
+        result = con.execute(sql, params or []).fetch_arrow_table()
+    finally:
+        for name in lookups:
+            con.unregister(name)
+
+    if path is not None:
+        os.makedirs(cache_dir(db_path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(result, tmp_path)
+        os.replace(tmp_path, path)
+    return result
+
+def clear_cache(db_path=DB_PATH):
+    directory = cache_dir(db_path)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
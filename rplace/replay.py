@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import shutil
+import zlib
+from datetime import datetime, timedelta
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rplace.dataset import HOUR_MS, read_parquet_sql, source_fingerprint
+from rplace.schema import CANVAS_SIZE, moderation_path, read_palette, replay_path
+from rplace.timestamps import check_time_format, to_epoch_ms
+
+# Canvas state at any time T from a compact canvas source, stored in
+# <stem>_replay/:
+#   meta.json              start, interval, number of keyframes, fingerprint
+#   keyframe-NNNNN.bin     zlib-compressed CANVAS_SIZE x CANVAS_SIZE uint8
+#                          palette indices, [x, y], holding every placement
+#                          before start + N * interval
+#   segment-NNNNN.parquet  the placements of [keyframe N, keyframe N + 1)
+#                          sorted by time, moderator rectangles expanded
+#                          into single pixels
+# Reconstructing T loads one keyframe and applies at most one interval of
+# placements; a timelapse loads one keyframe and then only moves forward.
+# The canvas starts white.
+
+INITIAL_COLOR = "#FFFFFF"
+SEGMENT_COLUMNS = ["timestamp", "x", "y", "pixel_color"]
+
+def _keyframe_file(path, index):
+    return os.path.join(path, f"keyframe-{index:05d}.bin")
+
+def _segment_file(path, index):
+    return os.path.join(path, f"segment-{index:05d}.parquet")
+
+# Last placement wins when a pixel is set more than once in one batch
+def apply_placements(canvas, x, y, colors):
+    keys = x.astype(np.int64) * CANVAS_SIZE + y
+    _, last_reversed = np.unique(keys[::-1], return_index=True)
+    last = len(keys) - 1 - last_reversed
+    canvas[x[last], y[last]] = colors[last]
+
+def _expand_rects(rects):
+    parts = []
+    for timestamp, color, x1, y1, x2, y2 in zip(*(rects.column(name).to_numpy() for name in rects.column_names)):
+        xs, ys = np.meshgrid(np.arange(x1, x2 + 1), np.arange(y1, y2 + 1), indexing="ij")
+        parts.append((np.full(xs.size, timestamp), xs.ravel(), ys.ravel(), np.full(xs.size, color)))
+    if not parts:
+        return None
+    timestamp, x, y, color = (np.concatenate(column) for column in zip(*parts))
+    return pa.table([
+        pa.array(timestamp, type=pa.int64()), pa.array(x, type=pa.uint16()),
+        pa.array(y, type=pa.uint16()), pa.array(color, type=pa.uint8()),
+    ], names=SEGMENT_COLUMNS)
+
+def _on_canvas(table):
+    x = table.column("x").to_numpy()
+    y = table.column("y").to_numpy()
+    return table.filter(pa.array((x < CANVAS_SIZE) & (y < CANVAS_SIZE)))
+
+def build_replay(source_path, interval_ms=HOUR_MS):
+    con = duckdb.connect()
+    first_ms, last_ms = con.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {read_parquet_sql(source_path)}").fetchone()
+    if first_ms is None:
+        raise ValueError(f"No placements in {source_path}")
+    start_ms = first_ms // interval_ms * interval_ms
+    count = (last_ms - start_ms) // interval_ms + 1
+
+    rects = None
+    if os.path.exists(moderation_path(source_path)):
+        rects = pq.read_table(moderation_path(source_path)).sort_by("timestamp")
+
+    path = replay_path(source_path)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    canvas = np.full((CANVAS_SIZE, CANVAS_SIZE), read_palette(source_path).index(INITIAL_COLOR), dtype=np.uint8)
+    for index in range(count):
+        with open(_keyframe_file(tmp_path, index), "wb") as file:
+            file.write(zlib.compress(canvas.tobytes()))
+
+        begin = start_ms + index * interval_ms
+        end = begin + interval_ms
+        segment = con.execute(f"""
+            SELECT timestamp, x, y, pixel_color
+            FROM {read_parquet_sql(source_path, begin, end)}
+            WHERE timestamp >= {begin} AND timestamp < {end} AND x IS NOT NULL AND pixel_color IS NOT NULL
+        """).fetch_arrow_table().cast(pa.schema([
+            ("timestamp", pa.int64()), ("x", pa.uint16()), ("y", pa.uint16()), ("pixel_color", pa.uint8()),
+        ]))
+        if rects is not None:
+            timestamps = rects.column("timestamp").to_numpy()
+            lo, hi = np.searchsorted(timestamps, [begin, end])
+            expanded = _expand_rects(rects.slice(lo, hi - lo))
+            if expanded is not None:
+                segment = pa.concat_tables([segment, expanded])
+        segment = _on_canvas(segment).sort_by("timestamp")
+        pq.write_table(segment, _segment_file(tmp_path, index))
+
+        apply_placements(canvas, segment.column("x").to_numpy(), segment.column("y").to_numpy(),
+                         segment.column("pixel_color").to_numpy())
+
+    with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+        json.dump({
+            "start_ms": start_ms, "interval_ms": interval_ms, "count": count,
+            "source_fingerprint": source_fingerprint(source_path),
+        }, file)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    print(f"Wrote {count} keyframes to {path}")
+
+def ensure_replay(source_path, interval_ms=HOUR_MS):
+    meta_file = os.path.join(replay_path(source_path), "meta.json")
+    if os.path.exists(meta_file):
+        with open(meta_file) as file:
+            meta = json.load(file)
+        if meta["source_fingerprint"] == source_fingerprint(source_path) and meta["interval_ms"] == interval_ms:
+            return
+    print("Building canvas replay keyframes...")
+    build_replay(source_path, interval_ms)
+
+class Replay:
+    def __init__(self, source_path):
+        self.path = replay_path(source_path)
+        self.palette = read_palette(source_path)
+        with open(os.path.join(self.path, "meta.json")) as file:
+            meta = json.load(file)
+        self.start_ms = meta["start_ms"]
+        self.interval_ms = meta["interval_ms"]
+        self.count = meta["count"]
+        self._segment_index = None
+        self._segment = None
+
+    def _index(self, ms):
+        return min(max((ms - self.start_ms) // self.interval_ms, 0), self.count - 1)
+
+    def keyframe(self, index):
+        with open(_keyframe_file(self.path, index), "rb") as file:
+            data = zlib.decompress(file.read())
+        return np.frombuffer(data, dtype=np.uint8).reshape(CANVAS_SIZE, CANVAS_SIZE).copy()
+
+    # (timestamps, x, y, colors) of one segment; the last one read is kept
+    def segment(self, index):
+        if index != self._segment_index:
+            table = pq.read_table(_segment_file(self.path, index))
+            self._segment = tuple(table.column(name).to_numpy() for name in SEGMENT_COLUMNS)
+            self._segment_index = index
+        return self._segment
+
+    # Applies the placements of segment `index` in [from_ms, to_ms)
+    def _advance(self, canvas, index, from_ms, to_ms):
+        timestamps, x, y, colors = self.segment(index)
+        lo, hi = np.searchsorted(timestamps, [from_ms, to_ms])
+        if hi > lo:
+            apply_placements(canvas, x[lo:hi], y[lo:hi], colors[lo:hi])
+
+    # Palette indices [x, y] after every placement before `time`
+    def canvas_at(self, time):
+        ms = to_epoch_ms(time)
+        index = self._index(ms)
+        canvas = self.keyframe(index)
+        self._advance(canvas, index, self.start_ms + index * self.interval_ms, ms)
+        return canvas
+
+    # Yields (time, canvas) from start_time to end_time every `step`,
+    # updating one canvas in place
+    def timelapse(self, start_time, end_time, step):
+        canvas = self.canvas_at(start_time)
+        time = start_time
+        ms = to_epoch_ms(start_time)
+        while time <= end_time:
+            yield time, canvas
+            next_time = time + step
+            next_ms = to_epoch_ms(next_time)
+            for index in range(self._index(ms), self._index(next_ms - 1) + 1):
+                self._advance(canvas, index, ms, next_ms)
+            time, ms = next_time, next_ms
+
+    # RGB image [y, x, 3] of a canvas
+    def render(self, canvas):
+        colors = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in self.palette], dtype=np.uint8)
+        return colors[canvas.T]
+
+def _parse_time(text):
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return check_time_format(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rplace.replay", description="Render the canvas at a time or as a timelapse")
+    parser.add_argument("source", help="compact canvas Parquet file or hourly dataset")
+    parser.add_argument("--at", help="YYYY-MM-DD HH[:MM[:SS]]; renders one PNG to --out")
+    parser.add_argument("--start", help="timelapse start, YYYY-MM-DD HH[:MM[:SS]]")
+    parser.add_argument("--end", help="timelapse end, YYYY-MM-DD HH[:MM[:SS]]")
+    parser.add_argument("--step-minutes", type=float, default=5)
+    parser.add_argument("--out", default="canvas.png", help="PNG file for --at, directory of frames for a timelapse")
+    args = parser.parse_args(argv)
+
+    import matplotlib.pyplot as plt
+
+    ensure_replay(args.source)
+    replay = Replay(args.source)
+    if args.at:
+        plt.imsave(args.out, replay.render(replay.canvas_at(_parse_time(args.at))))
+        print(f"Wrote {args.out}")
+    elif args.start and args.end:
+        os.makedirs(args.out, exist_ok=True)
+        frames = 0
+        for time, canvas in replay.timelapse(_parse_time(args.start), _parse_time(args.end), timedelta(minutes=args.step_minutes)):
+            plt.imsave(os.path.join(args.out, f"frame-{frames:05d}.png"), replay.render(canvas))
+            frames += 1
+        print(f"Wrote {frames} frames to {args.out}")
+    else:
+        parser.error("pass --at, or --start and --end")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from rplace.dataset import HOUR_MS, read_parquet_sql, source_fingerprint
+from rplace.schema import read_palette, rollup_colors_path, rollup_coordinates_path
+
+# Ingest-time rollups of a compact canvas source, written next to it:
+#   <stem>_rollup_colors.parquet       hour, pixel_color, count, cumulative
+#       dense over every (hour, color) from the first to the last hour;
+#       cumulative is the running total through that hour, so any hour
+#       range is one subtraction per color
+#   <stem>_rollup_coordinates.parquet  hour, x, y, count
+#       sparse, sorted by hour with row-group statistics, so an hour range
+#       reads only its own rows (a dense running total per coordinate would
+#       be 4M counters per hour)
+# `hour` is hours since the Unix epoch. Both files record the fingerprint of
+# the source they were built from and are rebuilt when it changes.
+
+FINGERPRINT_KEY = b"source_fingerprint"
+
+def _fingerprint(path):
+    if not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(FINGERPRINT_KEY, b"").decode() or None
+
+def _with_fingerprint(table, fingerprint):
+    return table.replace_schema_metadata({FINGERPRINT_KEY: fingerprint.encode()})
+
+def is_current(source_path):
+    fingerprint = source_fingerprint(source_path)
+    return all(
+        _fingerprint(path(source_path)) == fingerprint
+        for path in (rollup_colors_path, rollup_coordinates_path)
+    )
+
+def build_rollup(source_path, row_group_size=128_000):
+    fingerprint = source_fingerprint(source_path)
+    source = read_parquet_sql(source_path)
+    con = duckdb.connect()
+
+    colors = con.execute(f"""
+        SELECT timestamp // {HOUR_MS} AS hour, pixel_color, COUNT(*) AS count
+        FROM {source}
+        WHERE timestamp IS NOT NULL AND pixel_color IS NOT NULL
+        GROUP BY ALL
+    """).fetch_arrow_table()
+
+    num_colors = len(read_palette(source_path))
+    hours = colors.column("hour").to_numpy()
+    first = int(hours.min()) if len(hours) else 0
+    num_hours = int(hours.max()) - first + 1 if len(hours) else 0
+
+    grid = np.zeros((num_hours, num_colors), dtype=np.int64)
+    np.add.at(grid, (hours - first, colors.column("pixel_color").to_numpy()), colors.column("count").to_numpy())
+    colors_table = pa.table({
+        "hour": pa.array(np.repeat(np.arange(first, first + num_hours), num_colors), type=pa.int64()),
+        "pixel_color": pa.array(np.tile(np.arange(num_colors), num_hours), type=pa.uint8()),
+        "count": pa.array(grid.ravel()),
+        "cumulative": pa.array(np.cumsum(grid, axis=0).ravel()),
+    })
+    pq.write_table(_with_fingerprint(colors_table, fingerprint), rollup_colors_path(source_path))
+
+    coordinates = con.execute(f"""
+        SELECT timestamp // {HOUR_MS} AS hour, x, y, COUNT(*)::UINTEGER AS count
+        FROM {source}
+        WHERE timestamp IS NOT NULL AND x IS NOT NULL
+        GROUP BY ALL
+        ORDER BY hour, x, y
+    """).fetch_arrow_table()
+    pq.write_table(_with_fingerprint(coordinates, fingerprint), rollup_coordinates_path(source_path),
+                   row_group_size=row_group_size, write_statistics=True)
+
+    print(f"Rolled up {num_hours} hours of {source_path}: {coordinates.num_rows:,} coordinate-hours")
+
+def ensure_rollup(source_path):
+    if not is_current(source_path):
+        print("Building hourly rollup...")
+        build_rollup(source_path)
+
+def is_hour_aligned(dt):
+    return dt.minute == 0 and dt.second == 0 and dt.microsecond == 0
+
+# Color counts over the hours [start_hour, end_hour)
+def color_counts(source_path, start_hour, end_hour):
+    table = pq.read_table(rollup_colors_path(source_path), columns=["hour", "pixel_color", "cumulative"])
+    if not table.num_rows:
+        return np.zeros(0, dtype=np.int64)
+    num_colors = pc.max(table.column("pixel_color")).as_py() + 1
+    first = table.column("hour")[0].as_py()
+    cumulative = table.column("cumulative").to_numpy().reshape(-1, num_colors)
+
+    # Running total of every hour before `hour`
+    def before(hour):
+        index = min(hour, first + len(cumulative)) - first - 1
+        return cumulative[index] if index >= 0 else np.zeros(num_colors, dtype=np.int64)
+
+    return before(end_hour) - before(start_hour)
+
+def most_placed_color(source_path, start_hour, end_hour):
+    colors = color_counts(source_path, start_hour, end_hour)
+    if not len(colors) or colors.max() == 0:
+        return "None"
+    return read_palette(source_path)[int(colors.argmax())]
@@ -0,0 +1,202 @@
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from rplace.timestamps import parse_timestamps
+
+# Compact canvas layout written by convert_gzip_to_parquet(compact=True):
+#   timestamp    int64   epoch milliseconds (UTC)
+#   pixel_color  uint8   index into the palette side table
+#   x, y         uint16  canvas coordinates
+#   user_id      string  only when requested by the caller
+# Moderator rectangle edits ("x1,y1,x2,y2") go to a moderation side table.
+# Rows that fail normalize_table go to a quarantine side table with their
+# raw values and a rejection reason instead.
+
+CANVAS_SIZE = 2000
+
+# The 32 colors of the 2022 canvas. Listing them up front keeps palette
+# indices stable across files; unseen colors are appended after them.
+PALETTE_2022 = [
+    "#6D001A", "#BE0039", "#FF4500", "#FFA800", "#FFD635", "#FFF8B8", "#00A368", "#00CC78",
+    "#7EED56", "#00756F", "#009EAA", "#00CCC0", "#2450A4", "#3690EA", "#51E9F4", "#493AC1",
+    "#6A5CFF", "#94B3FF", "#811E9F", "#B44AC0", "#E4ABFF", "#DE107F", "#FF3881", "#FF99AA",
+    "#6D482F", "#9C6926", "#FFB470", "#000000", "#515252", "#898D90", "#D4D7D9", "#FFFFFF",
+]
+
+# At most 5 digits per value, so normalize_table can cast every match to an
+# integer; longer numbers are rejected as invalid coordinates
+POINT_PATTERN = r"^\s*(?P<x>\d{1,5})\s*,\s*(?P<y>\d{1,5})\s*$"
+RECT_PATTERN = r"^\s*(?P<x1>\d{1,5})\s*,\s*(?P<y1>\d{1,5})\s*,\s*(?P<x2>\d{1,5})\s*,\s*(?P<y2>\d{1,5})\s*$"
+COLOR_PATTERN = r"^#[0-9A-F]{6}$"
+
+# Checked in this order; a row is rejected for the first one it fails
+REJECTION_REASONS = ["invalid_timestamp", "invalid_color", "invalid_coordinate", "off_canvas"]
+
+def _stem(path):
+    return path[:-len(".parquet")] if path.endswith(".parquet") else path.rstrip("/\\")
+
+def palette_path(parquet_path):
+    return f"{_stem(parquet_path)}_palette.parquet"
+
+def moderation_path(parquet_path):
+    return f"{_stem(parquet_path)}_moderation.parquet"
+
+def rollup_colors_path(parquet_path):
+    return f"{_stem(parquet_path)}_rollup_colors.parquet"
+
+def rollup_coordinates_path(parquet_path):
+    return f"{_stem(parquet_path)}_rollup_coordinates.parquet"
+
+def pixel_counts_path(parquet_path):
+    return f"{_stem(parquet_path)}_pixel_counts.npy"
+
+def replay_path(parquet_path):
+    return f"{_stem(parquet_path)}_replay"
+
+def quarantine_path(parquet_path):
+    return f"{_stem(parquet_path)}_quarantine.parquet"
+
+def quality_report_path(parquet_path):
+    return f"{_stem(parquet_path)}_quality.json"
+
+def new_palette():
+    return {color: i for i, color in enumerate(PALETTE_2022)}
+
+def write_palette(palette, parquet_path):
+    colors = sorted(palette, key=palette.get)
+    table = pa.table({
+        "pixel_color": pa.array(range(len(colors)), type=pa.uint8()),
+        "hex": pa.array(colors, type=pa.string()),
+    })
+    pq.write_table(table, palette_path(parquet_path))
+
+def read_palette(parquet_path):
+    table = pq.read_table(palette_path(parquet_path)).sort_by("pixel_color")
+    return table.column("hex").to_pylist()
+
+def is_compact(parquet_path):
+    if not os.path.exists(parquet_path) or not os.path.exists(palette_path(parquet_path)):
+        return False
+    if os.path.isdir(parquet_path):
+        files = [
+            os.path.join(root, name) for root, _, names in os.walk(parquet_path)
+            for name in names if name.endswith(".parquet")
+        ]
+        if not files:
+            return False
+        parquet_path = files[0]
+    return pq.read_schema(parquet_path).field("timestamp").type == pa.int64()
+
+def format_coordinate(x, y):
+    return f"{x},{y}"
+
+def parse_coordinate(coordinate):
+    x, y = coordinate.split(",")
+    return int(x), int(y)
+
+def _canonical_colors(column):
+    return pc.utf8_upper(pc.utf8_trim_whitespace(column))
+
+def _encode_colors(column, palette):
+    colors = _canonical_colors(column).dictionary_encode()
+    if isinstance(colors, pa.ChunkedArray):
+        colors = colors.combine_chunks()
+    mapping = []
+    for color in colors.dictionary.to_pylist():
+        if color not in palette:
+            if len(palette) > 255:
+                raise ValueError(f"More than 256 distinct colors, cannot add {color}")
+            palette[color] = len(palette)
+        mapping.append(palette[color])
+    return pc.take(pa.array(mapping, type=pa.uint8()), colors.indices)
+
+def _extract_ints(column, pattern, names):
+    parts = pc.extract_regex(column, pattern)
+    return [pc.cast(pc.struct_field(parts, name), pa.uint16()) for name in names]
+
+def _integers(parts, name):
+    return pc.cast(pc.struct_field(parts, name), pa.int64())
+
+# Splits one batch of raw CSV columns into the rows compact_table can store
+# and the rejected ones. Returns (accepted rows, their parsed timestamps,
+# rejected rows as strings plus a "reason" column from REJECTION_REASONS).
+# Colors are accepted in any case and with surrounding spaces, since
+# compact_table canonicalizes them.
+def normalize_table(table):
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+
+    timestamps = parse_timestamps(table.column("timestamp"))
+    checks = [("invalid_timestamp", pc.is_null(timestamps))]
+
+    if "pixel_color" in table.column_names:
+        colors = _canonical_colors(table.column("pixel_color").combine_chunks())
+        checks.append(("invalid_color", pc.invert(pc.fill_null(pc.match_substring_regex(colors, COLOR_PATTERN), False))))
+
+    if "coordinate" in table.column_names:
+        coordinates = table.column("coordinate").combine_chunks()
+        points = pc.extract_regex(coordinates, POINT_PATTERN)
+        rects = pc.extract_regex(coordinates, RECT_PATTERN)
+        is_point = pc.is_valid(points)
+        is_rect = pc.is_valid(rects)
+        checks.append(("invalid_coordinate", pc.invert(pc.or_(is_point, is_rect))))
+
+        x, y = _integers(points, "x"), _integers(points, "y")
+        point_on_canvas = pc.and_(pc.less(x, CANVAS_SIZE), pc.less(y, CANVAS_SIZE))
+        x1, y1, x2, y2 = (_integers(rects, name) for name in ("x1", "y1", "x2", "y2"))
+        rect_on_canvas = pc.and_(
+            pc.and_(pc.less_equal(x1, x2), pc.less_equal(y1, y2)),
+            pc.and_(pc.less(x2, CANVAS_SIZE), pc.less(y2, CANVAS_SIZE)),
+        )
+        on_canvas = pc.if_else(is_point, point_on_canvas, pc.if_else(is_rect, rect_on_canvas, True))
+        checks.append(("off_canvas", pc.invert(pc.fill_null(on_canvas, False))))
+
+    reason = pa.nulls(table.num_rows, pa.string())
+    for name, failed in reversed(checks):
+        reason = pc.if_else(failed, name, reason)
+    accepted = pc.is_null(reason)
+    if pc.all(accepted).as_py() is not False:
+        return table, timestamps, None
+
+    rejected_mask = pc.invert(accepted)
+    rejected = pa.table(
+        [pc.cast(column, pa.string()) for column in table.filter(rejected_mask).columns] + [reason.filter(rejected_mask)],
+        names=table.column_names + ["reason"],
+    )
+    return table.filter(accepted), timestamps.filter(accepted), rejected
+
+# Converts one batch of raw CSV columns into the compact layout. Returns the
+# pixel table and the moderator rectangle table (None when the batch has no
+# coordinate column); `palette` is updated in place with any new colors.
+# `timestamps` skips parsing again when normalize_table already did.
+def compact_table(table, palette, timestamps=None):
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+
+    if timestamps is None:
+        timestamps = parse_timestamps(table.column("timestamp"))
+    colors = _encode_colors(table.column("pixel_color"), palette)
+    extra = [name for name in table.column_names if name not in ("timestamp", "pixel_color", "coordinate")]
+    extra_columns = [table.column(name) for name in extra]
+
+    if "coordinate" not in table.column_names:
+        return pa.table([timestamps, colors] + extra_columns, names=["timestamp", "pixel_color"] + extra), None
+
+    coordinates = table.column("coordinate").combine_chunks()
+    is_rect = pc.fill_null(pc.match_substring_regex(coordinates, RECT_PATTERN), False)
+
+    x, y = _extract_ints(coordinates, POINT_PATTERN, ["x", "y"])
+    pixels = pa.table(
+        [timestamps, colors, x, y] + extra_columns,
+        names=["timestamp", "pixel_color", "x", "y"] + extra,
+    ).filter(pc.invert(is_rect))
+
+    x1, y1, x2, y2 = _extract_ints(coordinates, RECT_PATTERN, ["x1", "y1", "x2", "y2"])
+    rects = pa.table(
+        [timestamps, colors, x1, y1, x2, y2] + extra_columns,
+        names=["timestamp", "pixel_color", "x1", "y1", "x2", "y2"] + extra,
+    ).filter(is_rect)
+
+    return pixels, rects
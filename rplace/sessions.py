@@ -0,0 +1,102 @@
+from rplace.db import DB_PATH, connect
+
+# Ingest-time sessionization of a canvas table with user ids. One sort by
+# (user_id, timestamp) splits each user's placements into sessions wherever
+# two consecutive placements are more than `gap_ms` apart, stored as
+#   <table>_sessions_<gap_ms>  user_id, session_start, session_end, placements
+# sorted by session_start. Each gap has its own table, rebuilt when the base
+# table is reloaded from a changed source (tracked in _sources like tables
+# loaded by load_canvas).
+
+SESSION_GAP_MS = 15 * 60 * 1000
+
+def sessions_table(table, gap_ms=SESSION_GAP_MS):
+    return f"{table}_sessions_{gap_ms}"
+
+def _fingerprint(con, name):
+    row = con.execute("SELECT fingerprint FROM _sources WHERE name = ?", [name]).fetchone()
+    return row[0] if row else None
+
+def build_sessions(table, gap_ms=SESSION_GAP_MS, db_path=DB_PATH):
+    con = connect(db_path)
+    fingerprint = _fingerprint(con, table)
+    if fingerprint is None:
+        raise ValueError(f"{table} was not loaded with load_canvas")
+
+    sessions = sessions_table(table, gap_ms)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {sessions} AS
+            WITH gaps AS (
+                SELECT
+                    user_id,
+                    timestamp,
+                    CASE
+                        WHEN timestamp - LAG(timestamp) OVER user_order > {gap_ms} THEN 1
+                        ELSE 0
+                    END AS is_new_session
+                FROM {table}
+                WHERE user_id IS NOT NULL
+                WINDOW user_order AS (PARTITION BY user_id ORDER BY timestamp)
+            ),
+            numbered AS (
+                SELECT
+                    user_id,
+                    timestamp,
+                    SUM(is_new_session) OVER (PARTITION BY user_id ORDER BY timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS session_id
+                FROM gaps
+            )
+            SELECT user_id, MIN(timestamp) AS session_start, MAX(timestamp) AS session_end, COUNT(*) AS placements
+            FROM numbered
+            GROUP BY user_id, session_id
+            ORDER BY session_start
+        """)
+        con.execute("INSERT OR REPLACE INTO _sources VALUES (?, ?, ?)", [sessions, table, fingerprint])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return sessions
+
+def ensure_sessions(table, gap_ms=SESSION_GAP_MS, db_path=DB_PATH):
+    con = connect(db_path)
+    sessions = sessions_table(table, gap_ms)
+    fingerprint = _fingerprint(con, table)
+    if fingerprint is None or _fingerprint(con, sessions) != fingerprint:
+        print(f"Building {sessions}...")
+        build_sessions(table, gap_ms, db_path)
+    return sessions
+
+# Average length in seconds of the sessions seen within [start_ms, end_ms],
+# counting only sessions with more than one placement in the window.
+# Sessions inside the window come straight from the sessions table. The
+# in-window placements of a session that crosses an edge are exactly one
+# session of the window alone, so those few are clipped against `events`
+# (the base table, or a table already holding the window's placements).
+def avg_session_length_sql(table, start_ms, end_ms, gap_ms=SESSION_GAP_MS, events=None):
+    events = events or table
+    return f"""
+        WITH overlapping AS (
+            SELECT *
+            FROM {sessions_table(table, gap_ms)}
+            WHERE session_start <= {end_ms} AND session_end >= {start_ms}
+        ),
+        clipped AS (
+            SELECT session_end - session_start AS session_duration, placements
+            FROM overlapping
+            WHERE session_start >= {start_ms} AND session_end <= {end_ms}
+            UNION ALL
+            SELECT MAX(e.timestamp) - MIN(e.timestamp), COUNT(*)
+            FROM overlapping s
+            JOIN {events} e
+                ON e.user_id = s.user_id
+                AND e.timestamp BETWEEN GREATEST(s.session_start, {start_ms}) AND LEAST(s.session_end, {end_ms})
+            WHERE (s.session_start < {start_ms} OR s.session_end > {end_ms})
+                AND e.timestamp BETWEEN {start_ms} AND {end_ms}
+            GROUP BY s.user_id, s.session_start
+        )
+        SELECT AVG(session_duration) / 1000 AS avg_session_length
+        FROM clipped
+        WHERE placements > 1
+    """
@@ -0,0 +1,154 @@
+import hashlib
+import heapq
+import math
+import numpy as np
+
+# Mergeable summaries for heavy hitters in fixed memory.
+#
+# SpaceSaving keeps at most `capacity` keys with an overestimated count and
+# the maximum overestimate (error) for each. Any key it does not hold has a
+# true count of at most the smallest held count. Two summaries merge by
+# adding counts, treating a missing key as that summary's minimum, and then
+# keeping the `capacity` largest (Agarwal et al., "Mergeable Summaries").
+#
+# CountMin is a depth x width table of counters. A point estimate never
+# undercounts. With probability 1 - exp(-depth) it overcounts by at most
+# e / width * total. Tables merge by addition.
+#
+# A HyperLogLog sketch is 2**HLL_PRECISION uint8 registers estimating the
+# number of distinct keys, with a standard error of 1.04 / sqrt(registers),
+# about 1.6% for 4096 registers (so about 3.2% at two standard errors;
+# single estimates can be off by more). Sketches merge with an element-wise
+# max.
+
+class SpaceSaving:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def _floor(self):
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def _combine(self, counts, errors, floor):
+        own_floor = self._floor()
+        merged_counts = {}
+        merged_errors = {}
+        for key in self.counts.keys() | counts.keys():
+            merged_counts[key] = self.counts.get(key, own_floor) + counts.get(key, floor)
+            merged_errors[key] = self.errors.get(key, own_floor) + errors.get(key, floor)
+
+        if len(merged_counts) > self.capacity:
+            keep = heapq.nlargest(self.capacity, merged_counts, key=merged_counts.get)
+            merged_counts = {key: merged_counts[key] for key in keep}
+            merged_errors = {key: merged_errors[key] for key in keep}
+
+        self.counts = merged_counts
+        self.errors = merged_errors
+
+    # Adds exact counts, e.g. the per-key totals of one chunk
+    def update(self, counts):
+        self._combine(counts, {}, 0)
+
+    def merge(self, other):
+        self._combine(other.counts, other.errors, other._floor())
+
+    def top(self, n=1):
+        return [
+            (key, self.counts[key] - self.errors[key], self.counts[key])
+            for key in heapq.nlargest(n, self.counts, key=self.counts.get)
+        ]
+
+class CountMin:
+    def __init__(self, width=2**15, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    # Double hashing: row i uses h1 + i * h2 from one 64-bit digest
+    def _columns(self, keys):
+        digests = np.array(
+            [int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little") for key in keys],
+            dtype=np.uint64,
+        )
+        h1 = digests & np.uint64(0xFFFFFFFF)
+        h2 = (digests >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, counts):
+        if not counts:
+            return
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        columns = self._columns(counts.keys())
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], values)
+        self.total += int(values.sum())
+
+    def merge(self, other):
+        self.table += other.table
+        self.total += other.total
+
+    def estimate(self, key):
+        columns = self._columns([key])[:, 0]
+        return int(self.table[np.arange(self.depth), columns].min())
+
+    def error_bound(self):
+        return math.ceil(math.e / self.width * self.total)
+
+    def confidence(self):
+        return 1 - math.exp(-self.depth)
+
+# Space-Saving for the candidate keys, Count-Min to tighten their upper bounds
+class HeavyHitters:
+    def __init__(self, capacity=1000, width=2**15, depth=4):
+        self.space_saving = SpaceSaving(capacity)
+        self.count_min = CountMin(width, depth)
+
+    def update(self, counts):
+        self.space_saving.update(counts)
+        self.count_min.update(counts)
+
+    def merge(self, other):
+        self.space_saving.merge(other.space_saving)
+        self.count_min.merge(other.count_min)
+
+    # (key, lower bound, upper bound) of the most frequent key, or None
+    def most_frequent(self):
+        candidates = [
+            (key, lower, min(upper, self.count_min.estimate(key)))
+            for key, lower, upper in self.space_saving.top(10)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda candidate: (candidate[2], candidate[1]))
+
+HLL_PRECISION = 12
+
+# splitmix64: a well-mixed 64-bit hash of integer keys
+def _hash64(values):
+    z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+# (register index, rank) of each integer key: the first HLL_PRECISION bits
+# pick the register, the rank is the position of the first 1 bit after them
+# (counted within the next 32 bits, which is plenty for 4096 registers)
+def hll_registers(keys):
+    hashes = _hash64(keys)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = ((hashes << np.uint64(HLL_PRECISION)) >> np.uint64(32)).astype(np.uint32)
+    bit_length = np.frexp(rest.astype(np.float64))[1]
+    return index, (33 - bit_length).astype(np.uint8)
+
+# Cardinality estimates from sketches of shape (..., 2**HLL_PRECISION)
+def hll_estimate(sketches):
+    m = sketches.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-sketches.astype(np.float64)), axis=-1)
+    zeros = np.count_nonzero(sketches == 0, axis=-1)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
@@ -0,0 +1,196 @@
+import argparse
+import gzip
+import os
+from datetime import datetime
+from time import perf_counter_ns
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from rplace.schema import CANVAS_SIZE
+from rplace.timestamps import to_epoch_ms
+
+# Seeded generator for synthetic canvas history in the layout of the real
+# 2022_place_canvas_history.csv.gzip:
+#   timestamp,user_id,pixel_color,coordinate
+#   2022-04-01 12:44:10.315 UTC,<88-char base64 hash>,#FF4500,"826,1048"
+# It reproduces the shape of the real data that the scripts are sensitive to:
+#   - about 83.5 hours from 2022-04-01 12:44 UTC with a day/night rate cycle,
+#     written in time order
+#   - both timestamp layouts (".fff" and whole seconds when the ms are 0)
+#   - the canvas growing from 1000x1000 to 2000x1000 to 2000x2000, with the
+#     palette growing from 16 to 24 to 32 colors at the same times
+#   - Zipf-skewed colors, a set of hot pixels taking a quarter of all
+#     placements, and heavy-tailed per-user activity at ~15 placements per
+#     distinct user
+#   - rare moderator rectangles ("x1,y1,x2,y2")
+# The same seed and row count always produce the same file.
+
+START = datetime(2022, 4, 1, 12, 44, 10)
+DURATION_HOURS = 83.5
+HEADER = b"timestamp,user_id,pixel_color,coordinate\n"
+ROWS_PER_USER = 15
+HOT_PIXELS = 2000
+HOT_FRACTION = 0.25
+RECT_FRACTION = 2e-6
+
+# (hours after START, canvas width, canvas height, colors available)
+PHASES = [
+    (0.0, 1000, 1000, 16),
+    (27.8, 2000, 1000, 24),
+    (54.3, 2000, 2000, 32),
+]
+
+# Palette in the order colors became available, most placed first within
+# each group
+COLORS = [
+    "#000000", "#FFFFFF", "#FF4500", "#2450A4", "#FFD635", "#3690EA", "#7EED56", "#FFA800",
+    "#B44AC0", "#811E9F", "#00A368", "#D4D7D9", "#898D90", "#FF99AA", "#51E9F4", "#9C6926",
+    "#BE0039", "#6D482F", "#515252", "#493AC1", "#FF3881", "#00CC78", "#009EAA", "#6A5CFF",
+    "#6D001A", "#00756F", "#DE107F", "#FFB470", "#94B3FF", "#FFF8B8", "#00CCC0", "#E4ABFF",
+]
+
+_B64 = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/", dtype=np.uint8)
+
+def _splitmix64(values):
+    with np.errstate(over="ignore"):
+        z = values + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+def _fixed_width_strings(chars):
+    count, width = chars.shape
+    offsets = np.arange(0, (count + 1) * width, width, dtype=np.int32)
+    return pa.StringArray.from_buffers(count, pa.py_buffer(offsets), pa.py_buffer(np.ascontiguousarray(chars)))
+
+# 64 pseudo-random bytes per user, base64-encoded like the real hashed IDs
+def user_hashes(user_ids, seed=0):
+    keys = user_ids.astype(np.uint64) * np.uint64(8) + np.uint64(seed) * np.uint64(0x100000000)
+    words = np.stack([_splitmix64(keys + np.uint64(k)) for k in range(8)], axis=1)
+    raw = words.view(np.uint8).reshape(len(user_ids), 64)
+
+    groups = raw[:, :63].reshape(len(user_ids), 21, 3).astype(np.uint32)
+    n24 = (groups[..., 0] << 16) | (groups[..., 1] << 8) | groups[..., 2]
+    sextets = np.stack([(n24 >> 18) & 63, (n24 >> 12) & 63, (n24 >> 6) & 63, n24 & 63], axis=-1)
+
+    chars = np.empty((len(user_ids), 88), dtype=np.uint8)
+    chars[:, :84] = _B64[sextets.reshape(len(user_ids), 84)]
+    chars[:, 84] = _B64[raw[:, 63] >> 2]
+    chars[:, 85] = _B64[(raw[:, 63] & 3) << 4]
+    chars[:, 86:] = ord("=")
+    return _fixed_width_strings(chars)
+
+def _zipf_weights(count, exponent=1.1):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+def _phase(hours):
+    return [phase for phase in PHASES if phase[0] <= hours][-1]
+
+def _format_timestamps(epoch_ms):
+    timestamps = pa.array(epoch_ms, type=pa.timestamp("ms"))
+    with_ms = pc.strftime(timestamps, format="%Y-%m-%d %H:%M:%S")
+    whole = pc.strftime(timestamps.cast(pa.timestamp("s"), safe=False), format="%Y-%m-%d %H:%M:%S")
+    text = pc.if_else(pa.array(epoch_ms % 1000 == 0), whole, with_ms)
+    return pc.binary_join_element_wise(text, " UTC", "")
+
+def _coordinates(rng, count, width, height, hot_x, hot_y, hot_weights):
+    x = rng.integers(0, width, count)
+    y = rng.integers(0, height, count)
+
+    inside = (hot_x < width) & (hot_y < height)
+    is_hot = rng.random(count) < HOT_FRACTION
+    if inside.any() and is_hot.any():
+        weights = hot_weights[inside] / hot_weights[inside].sum()
+        pick = rng.choice(int(inside.sum()), size=int(is_hot.sum()), p=weights)
+        x[is_hot] = hot_x[inside][pick]
+        y[is_hot] = hot_y[inside][pick]
+
+    coordinates = pc.binary_join_element_wise(pa.array(x).cast(pa.string()), pa.array(y).cast(pa.string()), ",")
+
+    is_rect = rng.random(count) < RECT_FRACTION
+    if is_rect.any():
+        x2 = np.minimum(x[is_rect] + rng.integers(1, 60, int(is_rect.sum())), width - 1)
+        y2 = np.minimum(y[is_rect] + rng.integers(1, 60, int(is_rect.sum())), height - 1)
+        rects = [f"{a},{b},{c},{d}" for a, b, c, d in zip(x[is_rect], y[is_rect], x2, y2)]
+        text = coordinates.to_numpy(zero_copy_only=False).astype(object)
+        text[is_rect] = rects
+        coordinates = pa.array(text, type=pa.string())
+    return coordinates
+
+def _chunk_lines(rng, seed, epoch_ms, num_users, hot):
+    count = len(epoch_ms)
+    hours = (epoch_ms[0] - to_epoch_ms(START)) / 3_600_000
+    _, width, height, num_colors = _phase(hours)
+
+    colors = pa.array(COLORS[:num_colors]).take(pa.array(rng.choice(num_colors, size=count, p=_zipf_weights(num_colors))))
+
+    # Heavy-tailed activity: low user numbers place far more often
+    users = np.minimum((num_users * rng.random(count) ** 3).astype(np.int64), num_users - 1)
+    unique_users, inverse = np.unique(users, return_inverse=True)
+    user_ids = user_hashes(unique_users, seed).take(pa.array(inverse))
+
+    coordinates = _coordinates(rng, count, width, height, *hot)
+    quoted = pc.binary_join_element_wise('"', coordinates, '"', "")
+
+    lines = pc.binary_join_element_wise(_format_timestamps(epoch_ms), user_ids, colors, quoted, ",")
+    lines = pc.binary_join_element_wise(lines, "\n", "")
+    if isinstance(lines, pa.ChunkedArray):
+        lines = lines.combine_chunks()
+
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32)[lines.offset:lines.offset + len(lines) + 1]
+    return memoryview(lines.buffers()[2])[offsets[0]:offsets[-1]]
+
+def generate_canvas(gzip_path, rows, seed=0, chunk_rows=1_000_000, compresslevel=6):
+    start_timer = perf_counter_ns()
+    rng = np.random.default_rng(seed)
+    num_users = max(1, rows // ROWS_PER_USER)
+
+    hot = (
+        rng.integers(0, CANVAS_SIZE, HOT_PIXELS),
+        rng.integers(0, CANVAS_SIZE, HOT_PIXELS),
+        _zipf_weights(HOT_PIXELS, 0.8),
+    )
+
+    # Rows per hour follow a day/night cycle peaking around 18:00 UTC
+    num_hours = int(np.ceil(DURATION_HOURS))
+    hour_starts = to_epoch_ms(START) + np.arange(num_hours, dtype=np.int64) * 3_600_000
+    utc_hour = (START.hour + np.arange(num_hours)) % 24
+    rate = 1 + 0.5 * np.cos((utc_hour - 18) / 24 * 2 * np.pi)
+    rate[-1] *= DURATION_HOURS - (num_hours - 1)
+    rows_per_hour = rng.multinomial(rows, rate / rate.sum())
+
+    tmp_path = f"{gzip_path}.tmp"
+    try:
+        # Fixed header name and mtime so the compressed bytes are reproducible too
+        with open(tmp_path, "wb") as raw, gzip.GzipFile("", "wb", compresslevel, raw, mtime=0) as file:
+            file.write(HEADER)
+            for hour, hour_rows in enumerate(rows_per_hour):
+                hour_length = 3_600_000 if hour < num_hours - 1 else int((DURATION_HOURS - hour) * 3_600_000)
+                pieces = max(1, int(np.ceil(hour_rows / chunk_rows)))
+                piece_length = hour_length // pieces
+                piece_rows = hour_rows // pieces + (np.arange(pieces) < hour_rows % pieces)
+                for piece in range(pieces):
+                    if not piece_rows[piece]:
+                        continue
+                    piece_start = hour_starts[hour] + piece * piece_length
+                    epoch_ms = np.sort(piece_start + rng.integers(0, piece_length, piece_rows[piece]))
+                    file.write(_chunk_lines(rng, seed, epoch_ms, num_users, hot))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, gzip_path)
+
+    seconds = (perf_counter_ns() - start_timer) / 1e9
+    print(f"Generated {rows:,} rows ({num_users:,} users, seed {seed}) in {seconds:.1f} s: {gzip_path}")
+    return {"rows": rows, "users": num_users, "seed": seed, "seconds": seconds}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m rplace.synthetic", description="Write synthetic canvas history")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="2022_place_canvas_history.csv.gzip")
+    args = parser.parse_args()
+    generate_canvas(args.out, args.rows, args.seed)
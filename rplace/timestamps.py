@@ -0,0 +1,87 @@
+import calendar
+from datetime import datetime
+
+# r/place timestamps come in two layouts:
+#   2022-04-01 12:44:10.315 UTC
+#   2022-04-01 12:44:10 UTC
+# Both are converted to integer milliseconds since the Unix epoch.
+
+_hour_cache = {}
+
+def to_epoch_ms(dt):
+    return calendar.timegm(dt.utctimetuple()) * 1000 + dt.microsecond // 1000
+
+# User-facing range bounds are whole hours
+def check_time_format(time_str):
+    try:
+        return datetime.strptime(time_str, "%Y-%m-%d %H")
+    except ValueError:
+        raise ValueError(f"Invalid format: {time_str}")
+
+def check_time_range(start_time, end_time):
+    if end_time <= start_time:
+        raise ValueError("End time should be after start time.")
+    return True
+
+def _parse_hour_prefix(prefix):
+    try:
+        return to_epoch_ms(datetime.strptime(prefix, "%Y-%m-%d %H"))
+    except ValueError:
+        raise ValueError(f"Invalid format: {prefix}")
+
+# Scalar path for the pure-Python engine. The "YYYY-MM-DD HH" prefix is
+# shared by ~1.5M consecutive rows, so its epoch value is cached and only
+# minutes, seconds and the fraction are parsed per row.
+def parse_timestamp(timestamp_str):
+    base = _hour_cache.get(timestamp_str[:13])
+    if base is None:
+        base = _parse_hour_prefix(timestamp_str[:13])
+        _hour_cache[timestamp_str[:13]] = base
+
+    minutes = timestamp_str[14:16]
+    seconds = timestamp_str[17:19]
+    fraction = timestamp_str[19:-4]
+    if (timestamp_str[13:14] != ":" or timestamp_str[16:17] != ":"
+            or not timestamp_str.endswith(" UTC")
+            or not minutes.isdigit() or not seconds.isdigit()
+            or int(minutes) > 59 or int(seconds) > 59):
+        raise ValueError(f"Invalid format: {timestamp_str}")
+
+    ms = 0
+    if fraction:
+        if fraction[0] != "." or not fraction[1:].isdigit():
+            raise ValueError(f"Invalid format: {timestamp_str}")
+        ms = int(fraction[1:4].ljust(3, "0"))
+
+    return base + (int(minutes) * 60 + int(seconds)) * 1000 + ms
+
+# Vectorized path: Arrow or NumPy string column -> Arrow int64 epoch-ms.
+# Rows that match neither layout come back as nulls. strptime rolls
+# impossible dates over (2022-02-30 becomes 2022-03-02), so a row is only
+# valid if its parsed value formats back to the same text, as datetime
+# parsing in parse_timestamp requires.
+def parse_timestamps(values):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    elif not isinstance(values, pa.Array):
+        values = pa.array(values, type=pa.string())
+
+    prefix = pc.utf8_slice_codeunits(values, 0, 19)
+    seconds = pc.strptime(prefix, format="%Y-%m-%d %H:%M:%S", unit="s", error_is_null=True)
+    round_trip = pc.equal(pc.strftime(seconds, format="%Y-%m-%d %H:%M:%S"), prefix)
+    valid = pc.and_(pc.ends_with(values, " UTC"), pc.fill_null(round_trip, False))
+
+    # "" for the whole-second layout, "." and any number of digits
+    # otherwise, of which the first three are the milliseconds
+    fraction = pc.utf8_slice_codeunits(values, 19, -4)
+    has_fraction = pc.starts_with(fraction, ".")
+    all_digits = pc.utf8_is_digit(pc.utf8_slice_codeunits(fraction, 1))
+    digits = pc.utf8_slice_codeunits(pc.utf8_rpad(pc.utf8_slice_codeunits(fraction, 1, 4), 3, "0"), 0, 3)
+    valid = pc.and_(valid, pc.or_(pc.equal(fraction, ""), pc.and_(has_fraction, all_digits)))
+    millis = pc.if_else(has_fraction, pc.cast(pc.if_else(valid, digits, "000"), pa.int64()), 0)
+
+    epoch_ms = pc.add(pc.multiply(pc.cast(seconds, pa.int64()), 1000), millis)
+    return pc.if_else(valid, epoch_ms, pa.scalar(None, pa.int64()))
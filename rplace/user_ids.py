@@ -0,0 +1,55 @@
+import os
+from itertools import repeat
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# One global user_id -> integer mapping shared by every ingest, stored as a
+# Parquet file with a single user_id column: a user's integer ID is its row
+# number. IDs are assigned in order of first appearance and never change,
+# so a later ingest that loads the file gives returning users their old IDs.
+
+USER_IDS_PATH = "user_ids.parquet"
+
+class UserIdEncoder:
+    def __init__(self, mapping_path=USER_IDS_PATH):
+        self.mapping_path = mapping_path
+        self.users = pa.chunked_array([], type=pa.string())
+        if os.path.exists(mapping_path):
+            self.users = pq.read_table(mapping_path, columns=["user_id"]).column("user_id")
+        # Persistent hash of every known user_id, extended only with new ones,
+        # so a lookup costs the same however many users are already mapped
+        self.ids = dict(zip(self.users.to_pylist(), range(len(self.users))))
+        self.saved = len(self.users)
+
+    # uint32 IDs for a column of user_id strings. Arrow hashes the column
+    # down to its distinct values, only those are looked up, the unseen ones
+    # get the next free IDs and are appended as one new chunk, and the IDs
+    # are spread back over the rows with one take.
+    def encode(self, column):
+        if isinstance(column, pa.ChunkedArray):
+            column = column.combine_chunks()
+        encoded = pc.dictionary_encode(column)
+        dictionary = encoded.dictionary
+        ids = np.fromiter(map(self.ids.get, dictionary.to_pylist(), repeat(-1)), dtype=np.int64, count=len(dictionary))
+        misses = ids < 0
+        if misses.any():
+            new_users = dictionary.filter(pa.array(misses))
+            new_ids = np.arange(len(self.users), len(self.users) + len(new_users))
+            ids[misses] = new_ids
+            self.ids.update(zip(new_users.to_pylist(), new_ids.tolist()))
+            self.users = pa.chunked_array(self.users.chunks + [new_users], type=pa.string())
+        return pc.take(pa.array(ids.astype(np.uint32)), encoded.indices)
+
+    def encode_table(self, table):
+        index = table.schema.get_field_index("user_id")
+        return table.set_column(index, "user_id", self.encode(table.column("user_id")))
+
+    def save(self):
+        if len(self.users) == self.saved:
+            return
+        tmp_path = f"{self.mapping_path}.tmp"
+        pq.write_table(pa.table({"user_id": self.users}), tmp_path)
+        os.replace(tmp_path, self.mapping_path)
+        self.saved = len(self.users)
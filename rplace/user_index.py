@@ -0,0 +1,76 @@
+import json
+import os
+import numpy as np
+
+from rplace.db import DB_PATH, connect
+
+# Per-user index of a canvas table with user ids, one record per user:
+#   user_id, first_seen, last_seen (epoch ms), placements (lifetime count)
+# sorted by first_seen and stored as a structured .npy file next to the
+# database, opened with mmap_mode="r". Users first seen in a time range are
+# one contiguous slice found with two binary searches, which touch only a
+# few pages of the file. A JSON sidecar records the fingerprint of the
+# table's source (from _sources); the index is rebuilt when it changes.
+
+INDEX_DTYPE = np.dtype([("user_id", np.int64), ("first_seen", np.int64), ("last_seen", np.int64), ("placements", np.int64)])
+
+def user_index_path(table, db_path=DB_PATH):
+    return os.path.join(os.path.dirname(db_path), f"{table}_user_index.npy")
+
+def _meta_path(table, db_path):
+    return os.path.splitext(user_index_path(table, db_path))[0] + ".json"
+
+def _table_fingerprint(table, db_path):
+    row = connect(db_path).execute("SELECT fingerprint FROM _sources WHERE name = ?", [table]).fetchone()
+    if row is None:
+        raise ValueError(f"{table} was not loaded with load_canvas")
+    return row[0]
+
+def build_user_index(table, db_path=DB_PATH):
+    users = connect(db_path).execute(f"""
+        SELECT user_id, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen, COUNT(*) AS placements
+        FROM {table}
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        ORDER BY first_seen, user_id
+    """).fetchnumpy()
+
+    path = user_index_path(table, db_path)
+    tmp_path = f"{path}.tmp.npy"
+    index = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=INDEX_DTYPE, shape=(len(users["user_id"]),))
+    for name in INDEX_DTYPE.names:
+        index[name] = users[name]
+    index.flush()
+    del index
+    os.replace(tmp_path, path)
+    with open(_meta_path(table, db_path), "w") as file:
+        json.dump({"source_fingerprint": _table_fingerprint(table, db_path)}, file)
+    print(f"Indexed {len(users['user_id']):,} users of {table} to {path}")
+
+def ensure_user_index(table, db_path=DB_PATH):
+    meta_path = _meta_path(table, db_path)
+    if os.path.exists(meta_path) and os.path.exists(user_index_path(table, db_path)):
+        with open(meta_path) as file:
+            if json.load(file)["source_fingerprint"] == _table_fingerprint(table, db_path):
+                return
+    print(f"Building user index of {table}...")
+    build_user_index(table, db_path)
+
+def open_user_index(table, db_path=DB_PATH):
+    return np.load(user_index_path(table, db_path), mmap_mode="r")
+
+# Slice of the index for users first seen in [start_ms, end_ms]
+def first_seen_between(index, start_ms, end_ms):
+    first_seen = index["first_seen"]
+    lo = np.searchsorted(first_seen, start_ms, side="left")
+    hi = np.searchsorted(first_seen, end_ms, side="right")
+    return index[lo:hi]
+
+def first_time_user_count(table, start_ms, end_ms, db_path=DB_PATH):
+    return len(first_seen_between(open_user_index(table, db_path), start_ms, end_ms))
+
+# Of the users first seen in [start_ms, end_ms], how many placed again at or
+# after `after_ms`
+def retained_user_count(table, start_ms, end_ms, after_ms, db_path=DB_PATH):
+    cohort = first_seen_between(open_user_index(table, db_path), start_ms, end_ms)
+    return int(np.count_nonzero(cohort["last_seen"] >= after_ms))
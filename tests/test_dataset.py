@@ -0,0 +1,37 @@
+import gzip
+import os
+import sys
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.convert import convert_gzip_to_parquet
+from rplace.dataset import dataset_files, ensure_partitioned, is_partitioned
+
+def convert(tmp_path, rows):
+    gzip_path = str(tmp_path / "canvas.csv.gzip")
+    with gzip.open(gzip_path, "wt") as file:
+        file.write("timestamp,user_id,pixel_color,coordinate\n")
+        for timestamp in rows:
+            file.write(f'{timestamp},a,#FF4500,"1,1"\n')
+    parquet_path = str(tmp_path / "canvas.parquet")
+    convert_gzip_to_parquet(gzip_path, parquet_path, compact=True)
+    return parquet_path
+
+def dataset_rows(dataset_path):
+    return sum(pq.read_metadata(file).num_rows for file in dataset_files(dataset_path))
+
+def test_dataset_follows_its_source(tmp_path):
+    dataset_path = str(tmp_path / "canvas_dataset")
+    parquet_path = convert(tmp_path, ["2022-04-01 12:00:00 UTC", "2022-04-01 13:00:00 UTC"])
+    assert not is_partitioned(parquet_path, dataset_path)
+
+    ensure_partitioned(parquet_path, dataset_path)
+    assert is_partitioned(parquet_path, dataset_path)
+    assert dataset_rows(dataset_path) == 2
+
+    parquet_path = convert(tmp_path, ["2022-04-01 12:00:00 UTC"])
+    assert not is_partitioned(parquet_path, dataset_path)
+
+    ensure_partitioned(parquet_path, dataset_path)
+    assert is_partitioned(parquet_path, dataset_path)
+    assert dataset_rows(dataset_path) == 1
@@ -0,0 +1,22 @@
+import os
+import sys
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.db import connect, load_canvas
+
+def test_raw_layout_skips_malformed_timestamps(tmp_path, capsys):
+    parquet_path = str(tmp_path / "raw.parquet")
+    pq.write_table(pa.table({
+        "timestamp": ["2022-04-01 12:44:10.315 UTC", "not a timestamp", "2022-02-30 12:00:00 UTC", "2022-04-01 12:44:11 UTC"],
+        "pixel_color": ["#FF4500", "#FF4500", "#FF4500", "#000000"],
+        "coordinate": ["1,2", "3,4", "5,6", "0,0,5,5"],
+    }), parquet_path)
+    db_path = str(tmp_path / "test.duckdb")
+
+    load_canvas(parquet_path, "raw", db_path)
+
+    rows = connect(db_path).execute("SELECT timestamp, pixel_color, x, y FROM raw ORDER BY timestamp").fetchall()
+    assert rows == [(1648817050315, "#FF4500", 1, 2), (1648817051000, "#000000", None, None)]
+    assert "Dropped 2 rows" in capsys.readouterr().out
@@ -0,0 +1,56 @@
+import gzip
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.gzindex import build_index, load_index, read_range, save_index
+
+SPAN = 64 * 1024
+
+def write_gzip(path, lines=60_000):
+    rng = random.Random(7)
+    with gzip.open(path, "wb") as file:
+        file.write(b"timestamp,user_id,pixel_color,coordinate\n")
+        for i in range(lines):
+            user = "".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(5, 60)))
+            file.write(f'2022-04-01 12:{i % 60:02d}:00 UTC,{user},#FF4500,"{rng.randint(0, 1999)},{rng.randint(0, 1999)}"\n'.encode())
+
+def test_ranges_reassemble_the_file(tmp_path):
+    path = str(tmp_path / "canvas.csv.gzip")
+    write_gzip(path)
+    with gzip.open(path, "rb") as file:
+        expected = file.read()
+
+    points = build_index(path, span=SPAN)
+    assert len(points) > 10
+    assert points[0].out == 0
+    # Checkpoints fall at deflate block boundaries, so most start mid-line
+    assert any(not point.line_start for point in points)
+    assert any(point.bits for point in points)
+
+    blocks = []
+    for i in range(len(points)):
+        blocks.extend(read_range(path, points, i, i + 1, chunk_bytes=SPAN // 4))
+    assert b"".join(blocks) == expected
+    assert all(block.endswith(b"\n") for block in blocks)
+
+    # Wider ranges split at other checkpoints give the same bytes
+    assert b"".join(read_range(path, points, 0, 3)) + b"".join(read_range(path, points, 3, len(points))) == expected
+
+    # Rows before each checkpoint match the decompressed output
+    for point in points:
+        assert point.rows == expected[:point.out].count(b"\n")
+
+def test_index_round_trip(tmp_path):
+    path = str(tmp_path / "canvas.csv.gzip")
+    write_gzip(path, lines=20_000)
+    points = build_index(path, span=SPAN)
+
+    assert load_index(path) is None
+    save_index(path, points)
+    assert load_index(path) == points
+
+    # A rewritten gzip file invalidates the index
+    write_gzip(path, lines=20_001)
+    assert load_index(path) is None
@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+import sys
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.convert import convert_gzip_to_parquet
+from rplace.schema import moderation_path, quality_report_path, quarantine_path
+
+ROWS = [
+    ("2022-04-01 12:44:10.315 UTC", "#FF4500", "10,20"),
+    ("2022-04-01 12:44:11 UTC", " #ff4500 ", "1999,1999"),
+    ("2022-04-01 12:45:00.1 UTC", "#000000", "0,0,5,5"),
+    ("2022-02-30 12:00:00 UTC", "#FF4500", "1,1"),
+    ("2022-04-01 24:00:00 UTC", "#FF4500", "1,1"),
+    ("2022-04-01 12:44:10.3x UTC", "#FF4500", "1,1"),
+    ("2022-04-01 12:44:10.3155x UTC", "#FF4500", "1,1"),
+    ("not a timestamp", "#FF4500", "1,1"),
+    ("2022-04-01 12:44:12 UTC", "#GG4500", "1,1"),
+    ("2022-04-01 12:44:13 UTC", "#FF4500", "99999999999999999999,1"),
+    ("2022-04-01 12:44:14 UTC", "#FF4500", "1,2,3,99999999999999999999"),
+    ("2022-04-01 12:44:15 UTC", "#FF4500", "abc"),
+    ("2022-04-01 12:44:16 UTC", "#FF4500", "2000,5"),
+    ("2022-04-01 12:44:17 UTC", "#FF4500", "99999,1"),
+    ("2022-04-01 12:44:18 UTC", "#FF4500", "5,5,1,1"),
+]
+
+EXPECTED = {
+    "2022-02-30 12:00:00 UTC": "invalid_timestamp",
+    "2022-04-01 24:00:00 UTC": "invalid_timestamp",
+    "2022-04-01 12:44:10.3x UTC": "invalid_timestamp",
+    "2022-04-01 12:44:10.3155x UTC": "invalid_timestamp",
+    "not a timestamp": "invalid_timestamp",
+    "2022-04-01 12:44:12 UTC": "invalid_color",
+    "2022-04-01 12:44:13 UTC": "invalid_coordinate",
+    "2022-04-01 12:44:14 UTC": "invalid_coordinate",
+    "2022-04-01 12:44:15 UTC": "invalid_coordinate",
+    "2022-04-01 12:44:16 UTC": "off_canvas",
+    "2022-04-01 12:44:17 UTC": "off_canvas",
+    "2022-04-01 12:44:18 UTC": "off_canvas",
+}
+
+def write_csv(path):
+    with gzip.open(path, "wt") as file:
+        file.write("timestamp,user_id,pixel_color,coordinate\n")
+        for i, (timestamp, color, coordinate) in enumerate(ROWS):
+            file.write(f'{timestamp},user{i},{color},"{coordinate}"\n')
+
+def test_malformed_rows_are_quarantined(tmp_path):
+    gzip_path = str(tmp_path / "canvas.csv.gzip")
+    parquet_path = str(tmp_path / "canvas.parquet")
+    write_csv(gzip_path)
+
+    convert_gzip_to_parquet(gzip_path, parquet_path, compact=True)
+
+    pixels = pq.read_table(parquet_path)
+    assert pixels.column("timestamp").to_pylist() == [1648817050315, 1648817051000]
+    assert pixels.column("x").to_pylist() == [10, 1999]
+    assert pq.read_table(moderation_path(parquet_path)).num_rows == 1
+
+    quarantine = pq.read_table(quarantine_path(parquet_path)).to_pydict()
+    assert dict(zip(quarantine["timestamp"], quarantine["reason"])) == EXPECTED
+
+    with open(quality_report_path(parquet_path)) as file:
+        report = json.load(file)
+    assert report["rows"] == len(ROWS)
+    assert report["pixels"] == 2
+    assert report["moderation_rects"] == 1
+    assert report["rejected"] == len(EXPECTED)
+    assert report["rejected_by_reason"] == {
+        "invalid_timestamp": 5,
+        "invalid_color": 1,
+        "invalid_coordinate": 3,
+        "off_canvas": 3,
+    }
+
+def test_failed_conversion_keeps_previous_outputs(tmp_path):
+    gzip_path = str(tmp_path / "canvas.csv.gzip")
+    parquet_path = str(tmp_path / "canvas.parquet")
+    write_csv(gzip_path)
+    convert_gzip_to_parquet(gzip_path, parquet_path, compact=True)
+    paths = (parquet_path, quarantine_path(parquet_path), moderation_path(parquet_path))
+    before = {path: open(path, "rb").read() for path in paths}
+
+    def fail(table):
+        raise RuntimeError("transform failed")
+
+    with pytest.raises(RuntimeError):
+        convert_gzip_to_parquet(gzip_path, parquet_path, compact=True, transform=fail)
+
+    assert {path: open(path, "rb").read() for path in before} == before
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+def test_rerun_without_rects_removes_moderation_file(tmp_path):
+    gzip_path = str(tmp_path / "canvas.csv.gzip")
+    parquet_path = str(tmp_path / "canvas.parquet")
+    write_csv(gzip_path)
+    convert_gzip_to_parquet(gzip_path, parquet_path, compact=True)
+    assert os.path.exists(moderation_path(parquet_path))
+
+    with gzip.open(gzip_path, "wt") as file:
+        file.write("timestamp,user_id,pixel_color,coordinate\n")
+        file.write('2022-04-01 12:44:10 UTC,user0,#FF4500,"10,20"\n')
+    convert_gzip_to_parquet(gzip_path, parquet_path, compact=True)
+
+    assert not os.path.exists(moderation_path(parquet_path))
+    assert not os.path.exists(quarantine_path(parquet_path))
@@ -0,0 +1,43 @@
+import gzip
+import os
+import sys
+from datetime import datetime
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.engines import python_engine
+
+START = datetime(2022, 4, 1, 12)
+END = datetime(2022, 4, 1, 13)
+
+def write_csv(path, rows):
+    with gzip.open(path, "wb") as file:
+        file.write(b"timestamp,user_id,pixel_color,coordinate\n")
+        for row in rows:
+            file.write(row + b"\n")
+
+def test_counts(tmp_path):
+    path = str(tmp_path / "canvas.csv.gzip")
+    write_csv(path, [
+        b'2022-04-01 12:00:01 UTC,a,#FF4500,"1,1"',
+        b'2022-04-01 12:30:00.5 UTC,b,#FF4500,"2,2"',
+        b'2022-04-01 12:59:59 UTC,c,#000000,"2,2"',
+        b'2022-04-01 13:00:00 UTC,d,#000000,"3,3"',
+    ] * 100)
+    assert python_engine.process_csv(path, START, END, chunk_bytes=256, num_workers=2) == ("#FF4500", "2,2")
+
+def test_worker_error_is_raised(tmp_path):
+    path = str(tmp_path / "canvas.csv.gzip")
+    write_csv(path, [b'2022-04-01 12:00:01 UTC,a,#FF4500,"1,1"'] * 1000 + [b'\xff\xfe,b,#FF4500,"1,1"'])
+    with pytest.raises(UnicodeDecodeError):
+        python_engine.process_csv(path, START, END, chunk_bytes=256, num_workers=2, queue_depth=1)
+
+def crash_worker(chunk_queue, result_queue, *args):
+    os._exit(3)
+
+def test_dead_worker_fails_the_run(tmp_path, monkeypatch):
+    path = str(tmp_path / "canvas.csv.gzip")
+    write_csv(path, [b'2022-04-01 12:00:01 UTC,a,#FF4500,"1,1"'] * 1000)
+    monkeypatch.setattr(python_engine, "count_worker", crash_worker)
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        python_engine.process_csv(path, START, END, chunk_bytes=256, num_workers=2, queue_depth=1)
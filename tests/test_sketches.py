@@ -0,0 +1,64 @@
+import os
+import sys
+from collections import Counter
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rplace.sketches import CountMin, HeavyHitters, SpaceSaving
+
+CAPACITY = 200
+SHARDS = 4
+CHUNK = 5000
+
+# A Zipf-skewed stream, split round-robin across workers that each fold
+# their chunks' exact counts into their own sketch, as python_engine does
+def skewed_stream():
+    keys = np.random.default_rng(3).zipf(1.3, 200_000)
+    return [f"k{key}" for key in keys[keys < 50_000]]
+
+def sharded(stream, new_sketch):
+    sketches = []
+    for shard in range(SHARDS):
+        part = stream[shard::SHARDS]
+        sketch = new_sketch()
+        for i in range(0, len(part), CHUNK):
+            sketch.update(Counter(part[i:i + CHUNK]))
+        sketches.append(sketch)
+    merged = sketches[0]
+    for other in sketches[1:]:
+        merged.merge(other)
+    return merged
+
+def test_space_saving_merge_keeps_top_k_and_bounds():
+    stream = skewed_stream()
+    true = Counter(stream)
+    sketch = sharded(stream, lambda: SpaceSaving(CAPACITY))
+
+    assert [key for key, _, _ in sketch.top(10)] == [key for key, _ in true.most_common(10)]
+    for key, lower, upper in sketch.top(CAPACITY):
+        assert lower <= true[key] <= upper
+    # Keys it dropped are no more frequent than its smallest count, and no
+    # overestimate exceeds total / capacity
+    floor = min(sketch.counts.values())
+    assert all(count <= floor for key, count in true.items() if key not in sketch.counts)
+    assert max(sketch.errors.values()) <= len(stream) / CAPACITY
+
+def test_count_min_merge_stays_within_bound():
+    stream = skewed_stream()
+    true = Counter(stream)
+    sketch = sharded(stream, lambda: CountMin(width=2048, depth=4))
+
+    assert sketch.total == len(stream)
+    overcounts = np.array([sketch.estimate(key) - count for key, count in true.items()])
+    assert overcounts.min() >= 0
+    assert np.mean(overcounts <= sketch.error_bound()) >= sketch.confidence()
+
+def test_heavy_hitters_most_frequent():
+    stream = skewed_stream()
+    true = Counter(stream)
+    sketch = sharded(stream, lambda: HeavyHitters(CAPACITY, width=2048))
+
+    key, lower, upper = sketch.most_frequent()
+    assert key == true.most_common(1)[0][0]
+    assert lower <= true[key] <= upper
+    assert HeavyHitters(CAPACITY).most_frequent() is None
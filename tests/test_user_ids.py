@@ -0,0 +1,40 @@
+import gzip
+import os
+import sys
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Week_3"))
+from preprocess import convert_with_user_ids
+
+def write_csv(path, users):
+    with gzip.open(path, "wt") as file:
+        file.write("timestamp,user_id,pixel_color,coordinate\n")
+        for i, user in enumerate(users):
+            file.write(f'2022-04-01 12:00:{i:02d} UTC,{user},#FF4500,"1,1"\n')
+
+def encoded_users(parquet_path, mapping_path):
+    names = pq.read_table(mapping_path).column("user_id").to_pylist()
+    ids = pq.read_table(parquet_path).column("user_id").to_pylist()
+    return ids, [names[i] for i in ids]
+
+def test_user_ids_are_stable_across_runs(tmp_path):
+    mapping_path = str(tmp_path / "user_ids.parquet")
+    first_users = ["alice", "bob", "alice", "carol"]
+    second_users = ["dave", "carol", "alice", "dave", "erin"]
+
+    write_csv(tmp_path / "first.csv.gzip", first_users)
+    convert_with_user_ids(str(tmp_path / "first.csv.gzip"), str(tmp_path / "first.parquet"), mapping_path)
+    first_ids, first_names = encoded_users(str(tmp_path / "first.parquet"), mapping_path)
+    assert first_names == first_users
+    assert first_ids == [0, 1, 0, 2]
+
+    write_csv(tmp_path / "second.csv.gzip", second_users)
+    convert_with_user_ids(str(tmp_path / "second.csv.gzip"), str(tmp_path / "second.parquet"), mapping_path)
+    second_ids, second_names = encoded_users(str(tmp_path / "second.parquet"), mapping_path)
+    assert second_names == second_users
+    # Returning users keep their IDs, new ones continue after the first run's
+    assert second_ids == [3, 2, 0, 3, 4]
+
+    # The first run's file still decodes with the extended mapping
+    assert encoded_users(str(tmp_path / "first.parquet"), mapping_path) == (first_ids, first_names)